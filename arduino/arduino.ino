@@ -36,6 +36,19 @@ const int NS_green_south  = 29;
 const int NS_yellow_south = 31;
 const int NS_red_south    = 33;
 
+// Binary frame format (see serial_protocol.py):
+//   0xA5 0x5A | type | seq | length | payload | CRC-16 (little-endian)
+// The CRC (CRC-16/CCITT-FALSE) covers type, seq, length and payload.
+const uint8_t SOF1 = 0xA5;
+const uint8_t SOF2 = 0x5A;
+const uint8_t TYPE_TIMERS = 0x01;  // Payload: flags, EW red time, NS red time
+const uint8_t TYPE_ACK = 0x81;     // Payload: status
+const uint8_t FLAG_EW = 0x01;
+const uint8_t FLAG_NS = 0x02;
+const uint8_t ACK_OK = 0;
+const uint8_t ACK_BAD_FRAME = 1;
+const uint8_t MAX_PAYLOAD = 32;
+
 // Turn off all EW signals
 void turnOffEW() {
   digitalWrite(EW_green_east, LOW);
@@ -69,6 +82,108 @@ void displayNumberGroup(ShiftRegister74HC595<4>& sr, int num) {
   sr.setAll(digits);
 }
 
+/*
+  crc16:
+  CRC-16/CCITT-FALSE (polynomial 0x1021, initial value 0xFFFF) over a buffer.
+*/
+uint16_t crc16(const uint8_t* data, uint8_t len) {
+  uint16_t crc = 0xFFFF;
+  for (uint8_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t b = 0; b < 8; b++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+/*
+  applyRedTime:
+  Shows redTime on the given direction group (red light) and (redTime - 3) on the
+  other group (green if redTime > 3, otherwise yellow).
+*/
+void applyRedTime(int redTime, bool ew) {
+  if (redTime <= 0) return;  // Invalid input
+
+  int oppositeTime = (redTime > 3) ? redTime - 3 : redTime;
+
+  // Update signals based on the direction
+  turnOffEW();
+  turnOffNS();
+
+  if (ew) {
+    // EW group is red; NS group shows oppositeTime
+    displayNumberGroup(sr_EW, redTime);
+    displayNumberGroup(sr_NS, oppositeTime);
+    digitalWrite(EW_red_east, HIGH);
+    digitalWrite(EW_red_west, HIGH);
+    if (redTime > 3) {
+      digitalWrite(NS_green_north, HIGH);
+      digitalWrite(NS_green_south, HIGH);
+    } else {
+      digitalWrite(NS_yellow_north, HIGH);
+      digitalWrite(NS_yellow_south, HIGH);
+    }
+  }
+  else {
+    // NS group is red; EW group shows oppositeTime
+    displayNumberGroup(sr_NS, redTime);
+    displayNumberGroup(sr_EW, oppositeTime);
+    digitalWrite(NS_red_north, HIGH);
+    digitalWrite(NS_red_south, HIGH);
+    if (redTime > 3) {
+      digitalWrite(EW_green_east, HIGH);
+      digitalWrite(EW_green_west, HIGH);
+    } else {
+      digitalWrite(EW_yellow_east, HIGH);
+      digitalWrite(EW_yellow_west, HIGH);
+    }
+  }
+}
+
+// Send an ACK frame for the given sequence number
+void sendAck(uint8_t seq, uint8_t status) {
+  uint8_t frame[8] = { SOF1, SOF2, TYPE_ACK, seq, 1, status, 0, 0 };
+  uint16_t crc = crc16(frame + 2, 4);
+  frame[6] = crc & 0xFF;
+  frame[7] = crc >> 8;
+  Serial.write(frame, sizeof(frame));
+}
+
+/*
+  readBinaryFrame:
+  Reads the rest of a binary frame after SOF1 has been consumed, applies a valid
+  TIMERS frame and acknowledges it. Damaged frames are answered with ACK_BAD_FRAME
+  so that the controller resends them at once.
+*/
+void readBinaryFrame() {
+  uint8_t header[4];  // SOF2, type, seq, length
+  if (Serial.readBytes(header, 4) != 4 || header[0] != SOF2 || header[3] > MAX_PAYLOAD) return;
+
+  uint8_t body[3 + MAX_PAYLOAD];
+  body[0] = header[1];
+  body[1] = header[2];
+  body[2] = header[3];
+  uint8_t len = header[3];
+  if (Serial.readBytes(body + 3, len) != len) return;
+
+  uint8_t crcBytes[2];
+  if (Serial.readBytes(crcBytes, 2) != 2) return;
+  uint16_t crc = crcBytes[0] | ((uint16_t)crcBytes[1] << 8);
+  uint8_t seq = body[1];
+  if (crc != crc16(body, 3 + len)) {
+    sendAck(seq, ACK_BAD_FRAME);
+    return;
+  }
+
+  if (body[0] == TYPE_TIMERS && len >= 3) {
+    uint8_t flags = body[3];
+    if (flags & FLAG_EW) applyRedTime(body[4], true);
+    if (flags & FLAG_NS) applyRedTime(body[5], false);
+    sendAck(seq, ACK_OK);
+  }
+}
+
 void setup() {
   Serial.begin(9600);
   
@@ -93,10 +208,20 @@ void setup() {
   turnOffNS();
   displayNumberGroup(sr_EW, 0);
   displayNumberGroup(sr_NS, 0);
+
+  // Tell control.py that the board has finished resetting and accepts commands
+  Serial.println("READY");
 }
 
 void loop() {
   if (Serial.available() > 0) {
+    // Binary frames start with SOF1, which never appears in the ASCII commands
+    if (Serial.peek() == SOF1) {
+      Serial.read();
+      readBinaryFrame();
+      return;
+    }
+
     String input = Serial.readStringUntil('\n');
     input.trim();
     
@@ -115,39 +240,11 @@ void loop() {
     int redTime = timeStr.toInt();
     if (redTime <= 0) return;  // Invalid input
     
-    int oppositeTime = (redTime > 3) ? redTime - 3 : redTime;
-    
-    // Update signals based on the direction
-    turnOffEW();
-    turnOffNS();
-    
     if (dirStr.equalsIgnoreCase("EW")) {
-      // EW group is red; NS group shows oppositeTime
-      displayNumberGroup(sr_EW, redTime);
-      displayNumberGroup(sr_NS, oppositeTime);
-      digitalWrite(EW_red_east, HIGH);
-      digitalWrite(EW_red_west, HIGH);
-      if (redTime > 3) {
-        digitalWrite(NS_green_north, HIGH);
-        digitalWrite(NS_green_south, HIGH);
-      } else {
-        digitalWrite(NS_yellow_north, HIGH);
-        digitalWrite(NS_yellow_south, HIGH);
-      }
+      applyRedTime(redTime, true);
     }
     else if (dirStr.equalsIgnoreCase("NS")) {
-      // NS group is red; EW group shows oppositeTime
-      displayNumberGroup(sr_NS, redTime);
-      displayNumberGroup(sr_EW, oppositeTime);
-      digitalWrite(NS_red_north, HIGH);
-      digitalWrite(NS_red_south, HIGH);
-      if (redTime > 3) {
-        digitalWrite(EW_green_east, HIGH);
-        digitalWrite(EW_green_west, HIGH);
-      } else {
-        digitalWrite(EW_yellow_east, HIGH);
-        digitalWrite(EW_yellow_west, HIGH);
-      }
+      applyRedTime(redTime, false);
     }
     // Wait for new serial data (no automatic countdown)
   }
@@ -0,0 +1,143 @@
+# arduino_emulator.py
+import argparse
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+from serial_protocol import (ACK_BAD_FRAME, ACK_OK, TYPE_ACK, TYPE_TIMERS, FrameParser,
+                             decode_timers, encode_frame)
+
+
+class ArduinoEmulator:
+    """
+    Emulates the traffic light Arduino (arduino/arduino.ino) on a pseudo-terminal.
+
+    control.py (or any pyserial client) opens `self.port` as if it were the
+    Arduino's serial port. Both the ASCII "redTime,direction\\n" commands and
+    binary TIMERS frames are understood; frames are acknowledged like the sketch does.
+    Linux/macOS only.
+
+    Parameters:
+        baud (int): Simulated line speed; delays each ACK by the transfer time of
+                    the frame and the ACK (0 = no delay).
+        drop_rate (float): Probability of silently dropping a received frame (tests retransmission).
+        boot_delay (float): Seconds before "READY" is printed, like the sketch after a reset.
+        verbose (bool): Print every command applied.
+    """
+
+    def __init__(self, baud=9600, drop_rate=0.0, verbose=False, boot_delay=0.0):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.baud = baud
+        self.drop_rate = drop_rate
+        self.verbose = verbose
+        self.boot_delay = boot_delay
+        self.parser = FrameParser()
+        # Red time last shown for each direction group
+        self.displays = {"EW": 0, "NS": 0}
+        self.stats = {"lines": 0, "frames": 0, "bad_frames": 0, "dropped": 0, "bytes": 0}
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _line_delay(self, nbytes):
+        # 10 bits per byte on the wire (start + 8 data + stop)
+        return nbytes * 10 / self.baud if self.baud else 0
+
+    def _run(self):
+        if self.boot_delay:
+            time.sleep(self.boot_delay)
+        os.write(self.master, b"READY\n")
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                break
+            self.stats["bytes"] += len(data)
+            for event in self.parser.feed(data):
+                self._handle(event)
+
+    def _handle(self, event):
+        kind = event[0]
+        if kind == "line":
+            self.stats["lines"] += 1
+            time_str, _, dir_str = event[1].partition(",")
+            try:
+                red_time = int(time_str.strip())
+            except ValueError:
+                return  # Invalid input
+            self._apply(red_time, dir_str.strip().upper())
+        elif kind == "bad":
+            self.stats["bad_frames"] += 1
+            self._ack(event[1], ACK_BAD_FRAME, 0)
+        elif kind == "frame" and event[1] == TYPE_TIMERS:
+            _, _, seq, payload = event
+            if random.random() < self.drop_rate:
+                self.stats["dropped"] += 1
+                return
+            self.stats["frames"] += 1
+            if len(payload) < 3:
+                self._ack(seq, ACK_BAD_FRAME, len(payload) + 7)
+                return
+            ew, ns = decode_timers(payload)
+            if ew is not None:
+                self._apply(ew, "EW")
+            if ns is not None:
+                self._apply(ns, "NS")
+            self._ack(seq, ACK_OK, len(payload) + 7)
+
+    def _apply(self, red_time, direction):
+        if red_time <= 0 or direction not in self.displays:
+            return
+        self.displays[direction] = red_time
+        if self.verbose:
+            print(f"{direction} red {red_time}")
+
+    def _ack(self, seq, status, received_bytes):
+        ack = encode_frame(TYPE_ACK, seq, bytes((status,)))
+        delay = self._line_delay(received_bytes + len(ack))
+        if delay:
+            time.sleep(delay)
+        os.write(self.master, ack)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arduino traffic light emulator on a pseudo-terminal")
+    parser.add_argument("--baud", type=int, default=9600, help="Simulated baud rate (0 = no line delay)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of frames to drop")
+    parser.add_argument("--quiet", action="store_true", help="Do not print applied commands")
+    parser.add_argument("--boot-delay", type=float, default=0.0, help="Seconds before READY is sent")
+    args = parser.parse_args()
+
+    emulator = ArduinoEmulator(args.baud, args.drop_rate, not args.quiet, args.boot_delay).start()
+    print("Arduino emulator listening on", emulator.port)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Emulator stopped.", emulator.stats)
+    finally:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
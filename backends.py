@@ -0,0 +1,209 @@
+# backends.py
+import os
+import threading
+import time
+
+import profiling
+
+# Default YOLOv8 weights used by the camera scripts
+DEFAULT_WEIGHTS = "yolov8n.pt"
+DEFAULT_IMGSZ = 640
+
+
+def _detections(results, names):
+    """Converts Ultralytics results into a list of (x1, y1, x2, y2, label) tuples."""
+    detections = []
+    for result in results:
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            continue
+        xyxy = boxes.xyxy.cpu().numpy().astype(int)
+        classes = boxes.cls.cpu().numpy().astype(int)
+        for (x1, y1, x2, y2), cls_id in zip(xyxy, classes):
+            detections.append((int(x1), int(y1), int(x2), int(y2), names[int(cls_id)]))
+    return detections
+
+
+class TorchBackend:
+    """
+    Default backend: the Ultralytics PyTorch runtime on the CPU.
+
+    Parameters:
+        weights (str): Path of the YOLOv8 .pt weights.
+        imgsz (int): Inference image size.
+    """
+    name = "torch"
+
+    def __init__(self, weights=DEFAULT_WEIGHTS, imgsz=DEFAULT_IMGSZ):
+        from ultralytics import YOLO
+
+        self.model = YOLO(weights)
+        self.names = self.model.names
+        self.imgsz = imgsz
+
+    @profiling.timed("inference")
+    def detect(self, frame):
+        """
+        Runs detection on one BGR frame.
+
+        Returns:
+            list: Tuples (x1, y1, x2, y2, label).
+        """
+        results = self.model(frame, imgsz=self.imgsz, device="cpu", verbose=False)
+        return _detections(results, self.names)
+
+
+class OnnxBackend:
+    """
+    Exported-ONNX backend run by ONNX Runtime on the CPU.
+
+    The model is exported next to the weights on first use, once per image size
+    (e.g. yolov8n-640.onnx), and reused afterwards. With `quantize=True`, the
+    exported model is additionally converted to dynamic INT8 weights (e.g.
+    yolov8n-640.int8.onnx). The PyTorch model is only loaded to export; the class
+    names come from the metadata of the ONNX model.
+
+    Parameters:
+        weights (str): Path of the YOLOv8 .pt weights.
+        imgsz (int): Inference image size (the ONNX model is exported with a fixed size).
+        quantize (bool): Use the dynamically quantized INT8 model.
+    """
+    name = "onnx"
+
+    def __init__(self, weights=DEFAULT_WEIGHTS, imgsz=DEFAULT_IMGSZ, quantize=False):
+        from ultralytics import YOLO
+
+        self.imgsz = imgsz
+        self.names = None  # Read from the ONNX metadata with the first results
+
+        # The exported model has a fixed input size, so each size has its own file
+        onnx_path = f"{os.path.splitext(weights)[0]}-{imgsz}.onnx"
+        if not _is_fresh(onnx_path, weights):
+            os.replace(YOLO(weights).export(format="onnx", imgsz=imgsz, device="cpu"), onnx_path)
+        if quantize:
+            self.name = "onnx-int8"
+            onnx_path = _quantize(onnx_path)
+
+        self.model = YOLO(onnx_path, task="detect")
+
+    @profiling.timed("inference")
+    def detect(self, frame):
+        """
+        Runs detection on one BGR frame.
+
+        Returns:
+            list: Tuples (x1, y1, x2, y2, label).
+        """
+        results = self.model(frame, imgsz=self.imgsz, device="cpu", verbose=False)
+        if self.names is None and results:
+            self.names = results[0].names
+        return _detections(results, self.names)
+
+
+def _is_fresh(path, source):
+    """Returns True if `path` exists and is not older than `source`."""
+    return (os.path.exists(path) and
+            (not os.path.exists(source) or os.path.getmtime(path) >= os.path.getmtime(source)))
+
+
+def _quantize(onnx_path):
+    """
+    Converts an ONNX model to dynamic INT8 weights (cached next to the input).
+
+    Returns:
+        str: Path of the quantized model.
+    """
+    int8_path = os.path.splitext(onnx_path)[0] + ".int8.onnx"
+    if _is_fresh(int8_path, onnx_path):
+        return int8_path
+    try:
+        import onnx
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise RuntimeError("INT8 quantization requires the onnx and onnxruntime packages") from e
+
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+
+    # Copy the Ultralytics metadata (stride, image size, names) to the quantized model
+    source = onnx.load(onnx_path)
+    quantized = onnx.load(int8_path)
+    existing = {p.key for p in quantized.metadata_props}
+    for prop in source.metadata_props:
+        if prop.key not in existing:
+            quantized.metadata_props.add(key=prop.key, value=prop.value)
+    onnx.save(quantized, int8_path)
+    return int8_path
+
+
+# Available backends: name -> factory(weights, imgsz)
+BACKENDS = {
+    "torch": lambda weights, imgsz: TorchBackend(weights, imgsz),
+    "onnx": lambda weights, imgsz: OnnxBackend(weights, imgsz),
+    "onnx-int8": lambda weights, imgsz: OnnxBackend(weights, imgsz, quantize=True),
+}
+
+
+def make_backend(name="torch", weights=DEFAULT_WEIGHTS, imgsz=DEFAULT_IMGSZ):
+    """
+    Creates an inference backend by name.
+
+    Parameters:
+        name (str): One of BACKENDS ("torch", "onnx", "onnx-int8").
+        weights (str): Path of the YOLOv8 .pt weights.
+        imgsz (int): Inference image size.
+
+    Returns:
+        An object with a `detect(frame)` method and a `name` attribute.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}; choose from {', '.join(BACKENDS)}")
+    return BACKENDS[name](weights, imgsz)
+
+
+class BackendLoader:
+    """
+    Creates and warms up a backend on a background thread.
+
+    Model loading and the first (slow) inference run while the caller opens the
+    video source, instead of on the critical path before the first frame.
+
+    Parameters:
+        name (str): Backend name (see make_backend()).
+        weights (str): Path of the YOLOv8 .pt weights.
+        imgsz (int): Inference image size.
+        warmup (bool): Run one inference on a blank frame after loading.
+    """
+
+    def __init__(self, name="torch", weights=DEFAULT_WEIGHTS, imgsz=DEFAULT_IMGSZ, warmup=True):
+        self.backend = None
+        self.error = None
+        self.load_time = None
+        self.warmup_time = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._load, args=(name, weights, imgsz, warmup), daemon=True)
+        self._thread.start()
+
+    def _load(self, name, weights, imgsz, warmup):
+        try:
+            start = time.perf_counter()
+            backend = make_backend(name, weights, imgsz)
+            self.load_time = time.perf_counter() - start
+            if warmup:
+                import numpy as np
+
+                start = time.perf_counter()
+                backend.detect(np.zeros((imgsz, imgsz, 3), dtype=np.uint8))
+                self.warmup_time = time.perf_counter() - start
+            self.backend = backend
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done.set()
+
+    def result(self, timeout=None):
+        """Waits for the backend and returns it; re-raises a loading error."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("Backend is still loading")
+        if self.error is not None:
+            raise self.error
+        return self.backend
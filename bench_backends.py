@@ -0,0 +1,137 @@
+# bench_backends.py
+import argparse
+import multiprocessing
+import time
+
+from backends import BACKENDS, DEFAULT_IMGSZ, DEFAULT_WEIGHTS
+from bench_utils import fmt, latency_summary, peak_rss_mb, save_json
+
+
+def run_backend(name, video, camera_name, weights, imgsz, frames, warmup):
+    """
+    Runs one backend over a video and measures it.
+
+    Executed in a fresh process so that the memory figures of one backend do not
+    include the models of the others.
+
+    Returns:
+        dict: Load time, FPS, latency percentiles, peak RSS and per-frame lane counts.
+    """
+    import cv2
+    from backends import make_backend
+    from cameras import CAMERAS, count_lanes, counts_vector
+
+    camera = CAMERAS[camera_name]
+    rss_before = peak_rss_mb()
+
+    start = time.perf_counter()
+    backend = make_backend(name, weights, imgsz)
+    load_time = time.perf_counter() - start
+
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video {video}")
+
+    latencies = []
+    counts = []
+    processed = 0
+    try:
+        while frames <= 0 or processed < frames + warmup:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            start = time.perf_counter()
+            detections = backend.detect(frame)
+            counts_lane1, counts_lane2, _ = count_lanes(detections, camera)
+            elapsed = time.perf_counter() - start
+            if processed >= warmup:
+                latencies.append(elapsed * 1000)
+                counts.append(counts_vector(counts_lane1, counts_lane2))
+            processed += 1
+    finally:
+        cap.release()
+
+    total = sum(latencies) / 1000
+    return {
+        "backend": name,
+        "frames": len(latencies),
+        "load_time_s": load_time,
+        "fps": len(latencies) / total if total > 0 else None,
+        "latency_ms": latency_summary(latencies),
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+        "counts": counts,
+    }
+
+
+def divergence(counts, reference):
+    """
+    Compares per-frame lane counts with the reference backend.
+
+    Returns:
+        dict: Mean/max absolute count error per frame (summed over lanes and classes),
+              fraction of frames with identical counts and relative difference of
+              the total number of counted vehicles.
+    """
+    n = min(len(counts), len(reference))
+    if n == 0:
+        return {"frames": 0, "mean_abs_error": None, "max_abs_error": None,
+                "exact_match": None, "total_rel_diff": None}
+    errors = [sum(abs(a - b) for a, b in zip(counts[i], reference[i])) for i in range(n)]
+    total = sum(sum(c) for c in counts[:n])
+    total_ref = sum(sum(c) for c in reference[:n])
+    return {
+        "frames": n,
+        "mean_abs_error": sum(errors) / n,
+        "max_abs_error": max(errors),
+        "exact_match": sum(1 for e in errors if e == 0) / n,
+        "total_rel_diff": (total - total_ref) / total_ref if total_ref else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CPU inference backends on a recorded video")
+    parser.add_argument("--video", default="EWcamera.mp4", help="Recorded video to run")
+    parser.add_argument("--camera", default="EW", choices=("EW", "NS"), help="Lane ROI configuration")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS),
+                        help="Backends to compare; the first one is the reference for the counts")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS, help="YOLOv8 weights")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ, help="Inference image size")
+    parser.add_argument("--frames", type=int, default=300, help="Frames to measure (0 = whole video)")
+    parser.add_argument("--warmup", type=int, default=5, help="Frames to run before measuring")
+    parser.add_argument("--output", default="bench_backends.json", help="JSON file for the results")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for name in args.backends:
+        print(f"Running backend {name} ...")
+        with ctx.Pool(1) as pool:
+            result = pool.apply(run_backend, (name, args.video, args.camera, args.weights,
+                                              args.imgsz, args.frames, args.warmup))
+        results.append(result)
+
+    reference = results[0]["counts"]
+    for result in results:
+        result["divergence"] = divergence(result["counts"], reference)
+
+    print(f"\nReference for counts: {results[0]['backend']}")
+    print(f"{'backend':<10} {'fps':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+          f"{'peak MB':>8} {'load s':>7} {'MAE':>6} {'exact':>6}")
+    for r in results:
+        lat = r["latency_ms"]
+        div = r["divergence"]
+        print(f"{r['backend']:<10} {fmt(r['fps']):>7} {fmt(lat['p50']):>8} {fmt(lat['p90']):>8} "
+              f"{fmt(lat['p99']):>8} {fmt(r['peak_rss_mb'], '.0f'):>8} {fmt(r['load_time_s']):>7} "
+              f"{fmt(div['mean_abs_error'], '.2f'):>6} {fmt(div['exact_match'], '.0%'):>6}")
+
+    save_json(args.output, {
+        "video": args.video,
+        "camera": args.camera,
+        "imgsz": args.imgsz,
+        "results": results,
+    })
+
+
+if __name__ == "__main__":
+    main()
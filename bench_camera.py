@@ -0,0 +1,179 @@
+# bench_camera.py
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from backends import BACKENDS, DEFAULT_IMGSZ, DEFAULT_WEIGHTS
+from bench_utils import fmt, latency_summary, peak_rss_mb, save_json
+
+# Pipeline stages timed for every frame
+STAGES = ("decode", "inference", "roi", "annotate", "total")
+
+# Metrics compared against a baseline: (path in the results, True if higher is better)
+COMPARED_METRICS = [("fps", True), ("peak_rss_mb", False)] + \
+                   [(f"stages_ms.{stage}.{stat}", False) for stage in STAGES for stat in ("mean", "p90")]
+
+
+def run_pipeline(video, camera_name, backend_name, weights, imgsz, frames, warmup, annotate):
+    """
+    Runs the camera detection pipeline over a recorded video without a display.
+
+    Each frame goes through the same steps as EWcamera.py / NScamera.py:
+    decode, inference, lane (ROI) assignment and, unless disabled, annotation.
+
+    Returns:
+        dict: Per-stage latency summaries (ms), end-to-end FPS, peak RSS and run metadata.
+    """
+    import cv2
+    from backends import make_backend
+    from cameras import CAMERAS, count_lanes, draw_overlay
+
+    camera = CAMERAS[camera_name]
+
+    start = time.perf_counter()
+    backend = make_backend(backend_name, weights, imgsz)
+    load_time = time.perf_counter() - start
+
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video {video}")
+
+    timings = {stage: [] for stage in STAGES}
+    processed = 0
+    wall_start = None
+    try:
+        while frames <= 0 or processed < frames + warmup:
+            if processed == warmup:
+                wall_start = time.perf_counter()
+
+            t0 = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            t1 = time.perf_counter()
+            detections = backend.detect(frame)
+            t2 = time.perf_counter()
+            counts_lane1, counts_lane2, counted = count_lanes(detections, camera)
+            t3 = time.perf_counter()
+            if annotate:
+                draw_overlay(frame, camera, detections, counted, counts_lane1, counts_lane2)
+            t4 = time.perf_counter()
+
+            if processed >= warmup:
+                for stage, elapsed in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t4 - t0)):
+                    timings[stage].append(elapsed * 1000)
+            processed += 1
+    finally:
+        cap.release()
+
+    measured = len(timings["total"])
+    wall = time.perf_counter() - wall_start if wall_start is not None else 0
+    return {
+        "meta": {
+            "video": video,
+            "camera": camera_name,
+            "backend": backend_name,
+            "weights": weights,
+            "imgsz": imgsz,
+            "annotate": annotate,
+            "frames": measured,
+            "warmup": warmup,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "load_time_s": load_time,
+        "fps": measured / wall if wall > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages_ms": {stage: latency_summary(values) for stage, values in timings.items()},
+    }
+
+
+def lookup(results, path):
+    value = results
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(results, baseline, tolerance, min_delta_ms=0.5):
+    """
+    Compares results with a baseline.
+
+    A metric regresses when it is worse than the baseline by more than `tolerance`
+    (relative, e.g. 0.10 = 10 %). Stage latencies must also be worse by more than
+    `min_delta_ms`, so that sub-millisecond stages do not fail on timer noise.
+
+    Returns:
+        list: (metric, baseline value, current value, relative change, regressed) tuples.
+    """
+    rows = []
+    for path, higher_is_better in COMPARED_METRICS:
+        old = lookup(baseline, path)
+        new = lookup(results, path)
+        if old is None or new is None or old == 0:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        regressed = worse > tolerance
+        if path.startswith("stages_ms.") and new - old <= min_delta_ms:
+            regressed = False
+        rows.append((path, old, new, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the camera pipeline over a recorded video")
+    parser.add_argument("--video", default="EWcamera.mp4", help="Recorded video to run")
+    parser.add_argument("--camera", default="EW", choices=("EW", "NS"), help="Lane ROI configuration")
+    parser.add_argument("--backend", default="torch", choices=sorted(BACKENDS), help="CPU inference backend")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS, help="YOLOv8 weights")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ, help="Inference image size")
+    parser.add_argument("--frames", type=int, default=0, help="Frames to measure (0 = whole video)")
+    parser.add_argument("--warmup", type=int, default=5, help="Frames to run before measuring")
+    parser.add_argument("--no-annotate", action="store_true", help="Skip the annotation stage")
+    parser.add_argument("--output", default="bench_camera.json", help="JSON file for the results")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Also save the results as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare the results with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Allowed relative regression before the comparison fails")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="Smallest stage latency increase (ms) counted as a regression")
+    args = parser.parse_args()
+
+    results = run_pipeline(args.video, args.camera, args.backend, args.weights, args.imgsz,
+                           args.frames, args.warmup, not args.no_annotate)
+
+    print(f"Frames: {results['meta']['frames']}  FPS: {fmt(results['fps'], '.2f')}  "
+          f"Peak RSS: {fmt(results['peak_rss_mb'], '.0f')} MB  Model load: {fmt(results['load_time_s'], '.2f')}s")
+    print(f"{'stage':<10} {'mean ms':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+    for stage in STAGES:
+        s = results["stages_ms"][stage]
+        if s["mean"] is None:
+            continue
+        print(f"{stage:<10} {s['mean']:>8.2f} {s['p50']:>8.2f} {s['p90']:>8.2f} {s['p99']:>8.2f}")
+
+    save_json(args.output, results)
+    if args.save_baseline:
+        save_json(args.save_baseline, results)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        print(f"\nComparison with {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for path, old, new, change, regressed in rows:
+            flag = "REGRESSION" if regressed else "ok"
+            print(f"  {path:<24} {old:>10.2f} -> {new:>10.2f} ({change:+.1%}) {flag}")
+        if any(row[4] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
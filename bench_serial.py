@@ -0,0 +1,100 @@
+# bench_serial.py
+import argparse
+import time
+
+import serial
+
+from arduino_emulator import ArduinoEmulator
+from bench_utils import latency_summary, save_json
+from serial_protocol import SerialLink
+
+
+def run_ascii(ser, updates, rate):
+    """
+    Sends `updates` ASCII updates (one "redTime,EW" and one "redTime,NS" line each).
+
+    The ASCII protocol has no acknowledgement, so only the write time is measured.
+    """
+    write_ms = []
+    nbytes = 0
+    period = 1.0 / rate if rate > 0 else 0
+    for i in range(updates):
+        start = time.perf_counter()
+        for cmd in (f"{15 + i % 30},EW\n", f"{18 + i % 30},NS\n"):
+            data = cmd.encode("utf-8")
+            ser.write(data)
+            nbytes += len(data)
+        write_ms.append((time.perf_counter() - start) * 1000)
+        if period:
+            time.sleep(period)
+    ser.flush()
+    return {"protocol": "ascii", "updates": updates, "bytes_per_update": nbytes / updates,
+            "write_ms": latency_summary(write_ms)}
+
+
+def run_binary(ser, updates, rate, ack_timeout, retries):
+    """Sends `updates` binary frames carrying both directions and measures the ACK round trip."""
+    link = SerialLink(ser, ack_timeout, retries)
+    period = 1.0 / rate if rate > 0 else 0
+    start = time.perf_counter()
+    try:
+        for i in range(updates):
+            link.send_timers(ew=15 + i % 30, ns=18 + i % 30)
+            if period:
+                time.sleep(period)
+        link.wait_idle(timeout=max(5.0, ack_timeout * (retries + 2)))
+    finally:
+        link.close()
+    elapsed = time.perf_counter() - start
+    return {"protocol": "binary", "updates": updates, "bytes_per_update": link.stats["bytes"] / updates,
+            "updates_per_s": updates / elapsed, "ack_rtt_ms": latency_summary(list(link.rtt_ms)),
+            "stats": dict(link.stats)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test and latency of the controller's serial path")
+    parser.add_argument("--port", help="Serial port to test (default: start an Arduino emulator on a pty)")
+    parser.add_argument("--baud", type=int, default=9600, help="Baud rate (also simulated by the emulator)")
+    parser.add_argument("--updates", type=int, default=200, help="Timer updates to send per protocol")
+    parser.add_argument("--rate", type=float, default=20.0, help="Updates per second (0 = as fast as possible)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Frames dropped by the emulator")
+    parser.add_argument("--ack-timeout", type=float, default=0.25, help="Seconds before a frame is resent")
+    parser.add_argument("--retries", type=int, default=3, help="Retransmissions per frame")
+    parser.add_argument("--output", default="bench_serial.json", help="JSON file for the results")
+    args = parser.parse_args()
+
+    emulator = None
+    port = args.port
+    if port is None:
+        emulator = ArduinoEmulator(args.baud, args.drop_rate).start()
+        port = emulator.port
+        print("Started Arduino emulator on", port)
+
+    results = []
+    try:
+        with serial.Serial(port, args.baud, timeout=0.05) as ser:
+            results.append(run_ascii(ser, args.updates, args.rate))
+            time.sleep(0.2)
+            ser.reset_input_buffer()
+            results.append(run_binary(ser, args.updates, args.rate, args.ack_timeout, args.retries))
+    finally:
+        if emulator is not None:
+            emulator.stop()
+
+    for r in results:
+        print(f"\n{r['protocol']}: {r['updates']} updates, {r['bytes_per_update']:.1f} bytes/update")
+        if "write_ms" in r:
+            w = r["write_ms"]
+            print(f"  write ms  p50={w['p50']:.3f} p99={w['p99']:.3f} max={w['max']:.3f} (no acknowledgement)")
+        else:
+            a = r["ack_rtt_ms"]
+            if a["p50"] is not None:
+                print(f"  ACK RTT ms p50={a['p50']:.2f} p90={a['p90']:.2f} p99={a['p99']:.2f} max={a['max']:.2f}")
+            print(f"  {r['updates_per_s']:.1f} updates/s, stats: {r['stats']}")
+
+    save_json(args.output, {"port": port, "baud": args.baud, "emulated": emulator is not None,
+                            "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# bench_startup.py
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from bench_utils import save_json
+
+# Entry points whose import and --help times are measured
+ENTRY_POINTS = ("control", "simulation", "EWcamera", "NScamera", "camera_pool")
+
+
+def timed_run(cmd, env=None):
+    """Runs a command to completion and returns its wall time (seconds)."""
+    start = time.perf_counter()
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, check=False)
+    return time.perf_counter() - start
+
+
+def median_time(cmd, repeat, env=None):
+    return statistics.median(timed_run(cmd, env) for _ in range(repeat))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def time_until_listening(cmd, port, timeout=30.0):
+    """
+    Starts a server process and returns the time until it accepts TCP connections
+    on `port`, or None if it does not within `timeout`.
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with socket.create_connection(("localhost", port), timeout=0.1):
+                    return time.perf_counter() - start
+            except OSError:
+                if proc.poll() is not None:
+                    return None
+                time.sleep(0.005)
+        return None
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def time_until_first_message(cmd, port, timeout=60.0, env=None):
+    """
+    Starts a client process that connects to a listener on `port` and returns the
+    time until its first message arrives, or None on timeout.
+    """
+    with socket.socket() as srv:
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        srv.bind(("localhost", port))
+        srv.listen(5)
+        srv.settimeout(0.1)
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL, env=env)
+        try:
+            while time.perf_counter() - start < timeout:
+                try:
+                    conn, _ = srv.accept()
+                except socket.timeout:
+                    if proc.poll() is not None:
+                        return None
+                    continue
+                with conn:
+                    conn.settimeout(max(0.1, timeout - (time.perf_counter() - start)))
+                    try:
+                        if conn.recv(1):
+                            return time.perf_counter() - start
+                    except socket.timeout:
+                        return None
+            return None
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def report(label, seconds):
+    value = "  failed" if seconds is None else f"{seconds * 1000:8.0f} ms"
+    print(f"{label:<40} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup time of each entry point")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (median is reported)")
+    parser.add_argument("--weights", default="yolov8n.pt",
+                        help="Weights for the camera time-to-first-sample measurement (skipped if missing)")
+    parser.add_argument("--output", default="bench_startup.json", help="JSON file for the results")
+    args = parser.parse_args()
+
+    py = sys.executable
+    results = {"python": median_time([py, "-c", "pass"], args.repeat)}
+    report("interpreter", results["python"])
+
+    for name in ENTRY_POINTS:
+        t_import = median_time([py, "-c", f"import {name}"], args.repeat)
+        t_help = median_time([py, f"{name}.py", "--help"], args.repeat)
+        results[f"{name}.import"] = t_import
+        results[f"{name}.help"] = t_help
+        report("import " + name, t_import)
+        report(name + ".py --help", t_help)
+
+    # control.py: time until the TCP server accepts connections
+    samples = []
+    for _ in range(args.repeat):
+        port = free_port()
+        samples.append(time_until_listening([py, "control.py", "--no-serial", "--port", str(port)], port))
+    samples = [t for t in samples if t is not None]
+    results["control.listening"] = statistics.median(samples) if samples else None
+    report("control.py listening", results["control.listening"])
+
+    # control.py with an Arduino that takes 2 s to boot: the port is opened in the background
+    if os.name == "posix":
+        from arduino_emulator import ArduinoEmulator
+
+        emulator = ArduinoEmulator(baud=0, boot_delay=2.0).start()
+        try:
+            port = free_port()
+            t = time_until_listening([py, "control.py", "--com-port", emulator.port, "--port", str(port)], port)
+        finally:
+            emulator.stop()
+        results["control.listening_with_arduino"] = t
+        report("control.py listening (Arduino boot 2s)", t)
+
+    # simulation.py: time until the first update reaches the controller
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy")
+    port = free_port()
+    t = time_until_first_message([py, "simulation.py", "--port", str(port)], port, env=env)
+    results["simulation.first_update"] = t
+    report("simulation.py first update", t)
+
+    # EWcamera.py: time until the first (unsmoothed) sample, including model load and warm-up
+    if os.path.exists(args.weights):
+        port = free_port()
+        t = time_until_first_message([py, "EWcamera.py", "--headless", "--weights", args.weights,
+                                      "--interval", "0", "--port", str(port)], port)
+        results["EWcamera.first_sample"] = t
+        report("EWcamera.py first sample", t)
+    else:
+        print(f"Skipping camera time-to-first-sample: {args.weights} not found")
+
+    save_json(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# bench_utils.py
+import json
+import math
+import sys
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile (0-100) of a list of numbers using linear interpolation.
+
+    Returns None for an empty list.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q / 100.0
+    lo = math.floor(k)
+    hi = math.ceil(k)
+    if lo == hi:
+        return ordered[int(k)]
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def latency_summary(values_ms):
+    """Returns mean and p50/p90/p99/max of a list of latencies (milliseconds)."""
+    if not values_ms:
+        return {"mean": None, "p50": None, "p90": None, "p99": None, "max": None}
+    return {
+        "mean": sum(values_ms) / len(values_ms),
+        "p50": percentile(values_ms, 50),
+        "p90": percentile(values_ms, 90),
+        "p99": percentile(values_ms, 99),
+        "max": max(values_ms),
+    }
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of the current process in MiB,
+    or None if it cannot be determined on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB on Linux
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def fmt(value, spec=".1f"):
+    """Formats a number, or "-" for a missing (None) value."""
+    return "-" if value is None else format(value, spec)
+
+
+def save_json(path, data):
+    """Writes benchmark results to a JSON file."""
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    print("Results written to", path)
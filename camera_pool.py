@@ -0,0 +1,259 @@
+# camera_pool.py
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backends import BACKENDS, DEFAULT_WEIGHTS
+from camera_stream import add_stream_arguments, streamer_from_args
+import tracing
+
+
+class FrameRing:
+    """
+    Fixed-size ring of BGR frames in a multiprocessing.shared_memory segment.
+
+    The decoder process writes frames into free slots; inference workers attach to
+    the same segment and read the frames through numpy views, so frames are never
+    pickled or copied between processes.
+
+    Parameters:
+        name (str): Name of the shared memory segment (None to generate one).
+        slots (int): Number of frames in the ring.
+        shape (tuple): Frame shape (height, width, 3).
+        create (bool): Create the segment (owner) or attach to an existing one.
+    """
+
+    def __init__(self, name, slots, shape, create=False):
+        self.slots = slots
+        self.shape = tuple(shape)
+        frame_size = int(np.prod(self.shape))
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=slots * frame_size)
+        self.name = self.shm.name
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    def frame(self, slot):
+        """Returns a view of the frame stored in a slot."""
+        return self.frames[slot]
+
+    def close(self, unlink=False):
+        # Drop the numpy view before closing, otherwise the buffer is still exported
+        self.frames = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def decoder_process(cam_idx, source, ring_name, slots, shape, free_slots, tasks, results):
+    """
+    Decodes a video into the camera's frame ring.
+
+    Blocks when all slots are in use, so decoding never runs ahead of inference by
+    more than the ring size. Reports ("eof", camera index, frame count) when done.
+    """
+    import cv2
+
+    ring = FrameRing(ring_name, slots, shape)
+    cap = cv2.VideoCapture(source)
+    frame_no = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            captured = tracing.now() if tracing.ENABLED else None
+            if frame.shape != ring.shape:
+                frame = cv2.resize(frame, (ring.shape[1], ring.shape[0]))
+            slot = free_slots.get()
+            np.copyto(ring.frame(slot), frame)
+            tasks.put((cam_idx, slot, frame_no, captured))
+            frame_no += 1
+    finally:
+        cap.release()
+        ring.close()
+        results.put(("eof", cam_idx, frame_no))
+
+
+def inference_worker(rings, camera_names, backend_name, weights, threads, free_slots, tasks, results):
+    """
+    Runs detection on frames taken from the rings and returns compact count arrays.
+
+    Each result is ("counts", camera index, frame number, bytes, capture time) where
+    the bytes hold 8 uint16 values: the car/bus/truck/motorcycle counts of lane 1, then
+    of lane 2. The capture time (tracing.now() in the decoder) is None unless tracing.
+    """
+    # Limit intra-op threads so that several workers can share the cores
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import cv2
+    from backends import make_backend
+    from cameras import CAMERAS, count_lanes, counts_vector
+
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    attached = [FrameRing(name, slots, shape) for name, slots, shape in rings]
+    cameras = [CAMERAS[name] for name in camera_names]
+    backend = make_backend(backend_name, weights)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            cam_idx, slot, frame_no, captured = task
+            detections = backend.detect(attached[cam_idx].frame(slot))
+            free_slots[cam_idx].put(slot)
+            counts_lane1, counts_lane2, _ = count_lanes(detections, cameras[cam_idx])
+            packed = np.asarray(counts_vector(counts_lane1, counts_lane2), dtype=np.uint16).tobytes()
+            results.put(("counts", cam_idx, frame_no, packed, captured))
+    finally:
+        for ring in attached:
+            ring.close()
+
+
+def frame_shape(source):
+    """Returns the (height, width, 3) shape of the frames of a video source."""
+    import cv2
+
+    cap = cv2.VideoCapture(source)
+    try:
+        ret, frame = cap.read()
+    finally:
+        cap.release()
+    if not ret:
+        raise RuntimeError(f"Cannot open video {source}")
+    return frame.shape
+
+
+def failed_processes(workers, decoders):
+    """
+    Returns the processes that exited abnormally: inference workers only exit when
+    told to, and decoders with a non-zero exit code.
+    """
+    return ([p for p in workers if p.exitcode is not None] +
+            [p for p in decoders if p.exitcode not in (None, 0)])
+
+
+def parse_camera(spec):
+    """Parses a camera argument "EW:EWcamera.mp4" into ("EW", source)."""
+    name, _, source = spec.partition(":")
+    if name not in ("EW", "NS"):
+        raise argparse.ArgumentTypeError(f"Unknown camera {name!r} (expected EW or NS)")
+    if not source:
+        from cameras import CAMERAS
+        source = CAMERAS[name]["video"]
+    return name, int(source) if source.isdigit() else source
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Multi-process camera pipeline: decoder processes fill shared-memory "
+                    "frame rings, a pool of inference workers returns lane counts")
+    parser.add_argument("--camera", action="append", type=parse_camera, required=True,
+                        help="Camera and source, e.g. EW:EWcamera.mp4 (repeatable)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Number of inference worker processes")
+    parser.add_argument("--threads", type=int, default=1, help="Inference threads per worker")
+    parser.add_argument("--slots", type=int, default=8, help="Frames per camera ring")
+    parser.add_argument("--backend", default="torch", choices=sorted(BACKENDS), help="CPU inference backend")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS, help="YOLOv8 weights")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream per-second counts of each camera to control.py")
+    add_stream_arguments(parser)
+    args = parser.parse_args()
+
+    from cameras import CAMERAS
+
+    ctx = multiprocessing.get_context("spawn")
+    camera_names = [name for name, _ in args.camera]
+    rings = []
+    free_slots = []
+    tasks = ctx.Queue()
+    results = ctx.Queue()
+    processes = []
+    streamers = None
+
+    try:
+        for name, source in args.camera:
+            ring = FrameRing(None, args.slots, frame_shape(source), create=True)
+            rings.append(ring)
+            free = ctx.Queue()
+            for slot in range(args.slots):
+                free.put(slot)
+            free_slots.append(free)
+
+        ring_specs = [(ring.name, ring.slots, ring.shape) for ring in rings]
+        workers = [ctx.Process(target=inference_worker, name=f"inference-{i}",
+                               args=(ring_specs, camera_names, args.backend, args.weights,
+                                     args.threads, free_slots, tasks, results), daemon=True)
+                   for i in range(args.workers)]
+        decoders = [ctx.Process(target=decoder_process, name=f"decoder-{name}",
+                                args=(i, source, rings[i].name, rings[i].slots, rings[i].shape,
+                                      free_slots[i], tasks, results), daemon=True)
+                    for i, (name, source) in enumerate(args.camera)]
+        processes = workers + decoders
+        for p in processes:
+            p.start()
+
+        streamers = ([streamer_from_args(name, CAMERAS[name]["directions"], args)
+                      for name in camera_names] if args.stream else None)
+
+        print(f"Running {len(decoders)} camera(s) on {len(workers)} worker(s)")
+        start = time.perf_counter()
+        last_report = start
+        done = [0] * len(camera_names)
+        expected = [None] * len(camera_names)
+        while any(e is None or d < e for d, e in zip(done, expected)):
+            # The frame of a crashed worker (or the rest of a crashed decoder's video)
+            # never arrives, so the pipeline stops instead of waiting forever
+            failed = failed_processes(workers, decoders)
+            if failed:
+                print("Stopping: " + ", ".join(f"{p.name} exited with code {p.exitcode}" for p in failed))
+                break
+            try:
+                msg = results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if msg[0] == "eof":
+                expected[msg[1]] = msg[2]
+                continue
+
+            _, cam_idx, frame_no, packed, captured = msg
+            done[cam_idx] += 1
+            if streamers is not None:
+                streamers[cam_idx].add_vector(np.frombuffer(packed, dtype=np.uint16).reshape(2, 4), captured)
+
+            now = time.perf_counter()
+            if now - last_report >= 5.0:
+                elapsed = now - start
+                rates = ", ".join(f"{name}={n / elapsed:.1f}" for name, n in zip(camera_names, done))
+                print(f"FPS per camera: {rates} (total {sum(done) / elapsed:.1f})")
+                last_report = now
+
+        elapsed = time.perf_counter() - start
+        print(f"Processed {sum(done)} frames in {elapsed:.1f}s ({sum(done) / elapsed:.1f} FPS total)")
+    except KeyboardInterrupt:
+        print("Stopped by user (Ctrl+C).")
+    finally:
+        for _ in range(args.workers):
+            tasks.put(None)
+        for p in processes:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        if streamers is not None:
+            for streamer in streamers:
+                streamer.close()
+        for ring in rings:
+            ring.close(unlink=True)
+
+
+if __name__ == "__main__":
+    main()
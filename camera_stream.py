@@ -0,0 +1,199 @@
+# camera_stream.py
+import json
+import socket
+import time
+
+import numpy as np
+
+import tracing
+
+# Vehicle classes counted by the cameras (same keys as the weights in control.py)
+VEHICLE_CLASSES = ("car", "bus", "truck", "motorcycle")
+
+# Delay before trying to reconnect to control.py after a failed connection (seconds)
+RECONNECT_DELAY = 2.0
+
+# Smoothing methods supported by CountSmoother
+SMOOTHING_METHODS = ("median", "ema", "mean")
+
+
+class CountSmoother:
+    """
+    Smooths per-frame lane counts over a sliding window of recent frames.
+
+    The counts of the last `window` frames are kept in a fixed-size ring buffer
+    (frames x lanes x classes), so a vehicle that is missed or detected twice in a
+    few frames does not change the smoothed value.
+
+    Parameters:
+        lanes (int): Number of lanes.
+        method (str): "median" or "mean" of the window, or "ema" (exponential moving average).
+        window (int): Number of frames in the window (median/mean).
+        alpha (float): Smoothing factor of the EMA.
+    """
+
+    def __init__(self, lanes=2, method="median", window=30, alpha=0.2):
+        if method not in SMOOTHING_METHODS:
+            raise ValueError(f"Unknown smoothing method {method!r}")
+        self.method = method
+        self.alpha = alpha
+        self.buffer = np.zeros((max(1, window), lanes, len(VEHICLE_CLASSES)), dtype=np.uint16)
+        self.pos = 0
+        self.filled = 0
+        self.ema = np.zeros((lanes, len(VEHICLE_CLASSES)), dtype=np.float64)
+
+    def add(self, counts):
+        """
+        Adds the counts of one frame.
+
+        Parameters:
+            counts (numpy.ndarray): Array of shape (lanes, classes).
+        """
+        self.buffer[self.pos] = counts
+        self.pos = (self.pos + 1) % len(self.buffer)
+        if self.filled == 0:
+            self.ema[:] = counts
+        else:
+            self.ema += self.alpha * (counts - self.ema)
+        self.filled = min(self.filled + 1, len(self.buffer))
+
+    def value(self):
+        """Returns the smoothed counts as an integer array of shape (lanes, classes)."""
+        if self.filled == 0:
+            return np.zeros(self.ema.shape, dtype=np.int64)
+        if self.method == "ema":
+            smoothed = self.ema
+        elif self.method == "median":
+            smoothed = np.median(self.buffer[:self.filled], axis=0)
+        else:
+            smoothed = self.buffer[:self.filled].mean(axis=0)
+        return np.rint(smoothed).astype(np.int64)
+
+
+class CountStreamer:
+    """
+    Smooths per-frame lane counts from a camera, emits one sample per interval
+    and pushes the samples to control.py over a persistent TCP connection.
+
+    Each sample uses the same per-direction schema that process_data() reads, e.g.
+        {"source": "camera", "camera": "EW",
+         "east": {"car": 2, "bus": 0, "truck": 1, "motorcycle": 0},
+         "west": {"car": 1, "bus": 0, "truck": 0, "motorcycle": 3}}
+    Samples are sent as newline-delimited JSON, so a 30 FPS camera produces one
+    message per interval instead of 30 per second.
+
+    Parameters:
+        camera (str): Camera identifier ("EW" or "NS").
+        directions (tuple): Direction names for lane 1 and lane 2 (e.g. ("east", "west")).
+        host (str): Host of the control server.
+        port (int): Port of the control server.
+        interval (float): Time between two samples (seconds).
+        smoothing (str): Smoothing method of the CountSmoother ("median", "ema" or "mean").
+        window (int): Number of frames in the smoothing window.
+    """
+
+    def __init__(self, camera, directions, host="localhost", port=12345, interval=1.0,
+                 smoothing="median", window=30):
+        self.camera = camera
+        self.directions = tuple(directions)
+        self.address = (host, port)
+        self.interval = interval
+        self.smoother = CountSmoother(len(self.directions), smoothing, window)
+        self.sock = None
+        self.next_connect_time = 0.0
+        self.samples_sent = 0
+        self.last_emit = None
+
+    def add(self, *lane_counts, captured=None):
+        """
+        Adds the counts of one frame and sends a sample once the interval has elapsed.
+
+        Parameters:
+            *lane_counts (dict): One count dictionary per lane, in the order of `directions`.
+            captured (int): tracing.now() when the frame was read, for latency traces.
+        """
+        self.add_vector(np.array([[counts.get(k, 0) for k in VEHICLE_CLASSES] for counts in lane_counts]),
+                        captured)
+
+    def add_vector(self, counts, captured=None):
+        """
+        Same as add(), with the counts of one frame given as an array of shape (lanes, classes).
+        """
+        now = time.monotonic()
+        if self.last_emit is None:
+            self.last_emit = now
+        self.smoother.add(counts)
+
+        if now - self.last_emit >= self.interval:
+            sample = self.build_sample()
+            if tracing.ENABLED:
+                # Trace the latest frame of the window from its capture
+                if captured is None:
+                    sample["trace"] = tracing.start(f"camera-{self.camera}", "detect")
+                else:
+                    sample["trace"] = tracing.start(f"camera-{self.camera}", "capture", captured)
+                    tracing.stamp(sample["trace"], "detect")
+            self.send(sample)
+            self.last_emit = now
+
+    def build_sample(self):
+        """Returns a sample with the current smoothed counts."""
+        sample = {"source": "camera", "camera": self.camera}
+        for direction, counts in zip(self.directions, self.smoother.value()):
+            sample[direction] = dict(zip(VEHICLE_CLASSES, counts.tolist()))
+        return sample
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self.next_connect_time:
+            return False
+        try:
+            self.sock = socket.create_connection(self.address, timeout=RECONNECT_DELAY)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            print("Connected to control server at %s:%d" % self.address)
+            return True
+        except OSError as e:
+            print("Unable to connect to control server:", e)
+            self.sock = None
+            self.next_connect_time = now + RECONNECT_DELAY
+            return False
+
+    def send(self, sample):
+        """
+        Sends one sample to the control server. Samples produced while the
+        server is unreachable are dropped; the connection is retried later.
+        """
+        if self.sock is None and not self._connect():
+            return
+        try:
+            tracing.stamp(sample.get("trace"), "send")
+            self.sock.sendall((json.dumps(sample, separators=(",", ":")) + "\n").encode())
+            self.samples_sent += 1
+        except OSError as e:
+            print("Error sending sample to control server:", e)
+            self.close()
+            self.next_connect_time = time.monotonic() + RECONNECT_DELAY
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+def add_stream_arguments(parser):
+    """Adds the command line options of the sample stream to an argparse parser."""
+    parser.add_argument("--host", default="localhost", help="Control server host")
+    parser.add_argument("--port", type=int, default=12345, help="Control server port")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between two samples")
+    parser.add_argument("--smoothing", default="median", choices=SMOOTHING_METHODS,
+                        help="Smoothing of the per-frame counts")
+    parser.add_argument("--window", type=int, default=30, help="Frames in the smoothing window")
+
+
+def streamer_from_args(camera, directions, args):
+    """Creates a CountStreamer from options added by add_stream_arguments()."""
+    return CountStreamer(camera, directions, args.host, args.port, args.interval,
+                         args.smoothing, args.window)
@@ -0,0 +1,142 @@
+# cameras.py
+import cv2
+import numpy as np
+
+import profiling
+
+# Allowed detection labels
+allowed_labels = {"car", "bus", "truck", "motorcycle"}
+
+# Lane ROI configuration of each camera.
+#   directions: direction names of lane 1 and lane 2 (keys of the control.py data schema)
+#   lane_names: abbreviations shown on the video overlay
+#   exclusive:  True if a vehicle is only counted in the first lane that contains it
+#   draw_all:   True to draw every detected vehicle, False to draw only counted ones
+CAMERAS = {
+    "EW": {
+        "video": "EWcamera.mp4",
+        "window": "East-West Camera",
+        "directions": ("east", "west"),
+        "lane_names": ("E", "W"),
+        "exclusive": True,
+        "draw_all": True,
+        "polygons": (
+            np.array([
+                [0, 150],
+                [1280, 420],
+                [1280, 650],
+                [0, 260]
+            ], dtype=np.int32),
+            np.array([
+                [0, 220],
+                [1280, 620],
+                [400, 700],
+                [0, 420]
+            ], dtype=np.int32),
+        ),
+    },
+    "NS": {
+        "video": "NScamera.mp4",
+        "window": "Video",
+        "directions": ("north", "south"),
+        "lane_names": ("N", "S"),
+        "exclusive": False,
+        "draw_all": False,
+        "polygons": (
+            np.array([
+                [0, 30],
+                [1280, 470],
+                [1280, 650],
+                [0, 80]
+            ], dtype=np.int32),
+            np.array([
+                [0, 90],
+                [1280, 650],
+                [590, 720],
+                [0, 250]
+            ], dtype=np.int32),
+        ),
+    },
+}
+
+
+@profiling.timed("count_lanes")
+def count_lanes(detections, camera):
+    """
+    Counts vehicles per lane from a list of detections.
+
+    A vehicle is counted in a lane if the center of its bounding box lies inside
+    the lane polygon.
+
+    Parameters:
+        detections (list): Tuples (x1, y1, x2, y2, label) returned by a backend.
+        camera (dict): Camera configuration from CAMERAS.
+
+    Returns:
+        tuple: (counts_lane1, counts_lane2, counted) where `counted` lists the
+               detections that were counted in at least one lane.
+    """
+    lane1_polygon, lane2_polygon = camera["polygons"]
+    counts_lane1 = {"car": 0, "bus": 0, "truck": 0, "motorcycle": 0}
+    counts_lane2 = {"car": 0, "bus": 0, "truck": 0, "motorcycle": 0}
+    counted = []
+
+    for det in detections:
+        x1, y1, x2, y2, label = det
+        if label not in allowed_labels:
+            continue
+
+        # Calculate the center of the bounding box
+        center = ((x1 + x2) // 2, (y1 + y2) // 2)
+
+        in_lane1 = cv2.pointPolygonTest(lane1_polygon, center, False) >= 0
+        if in_lane1 and camera["exclusive"]:
+            in_lane2 = False
+        else:
+            in_lane2 = cv2.pointPolygonTest(lane2_polygon, center, False) >= 0
+
+        if in_lane1:
+            counts_lane1[label] += 1
+        if in_lane2:
+            counts_lane2[label] += 1
+        if in_lane1 or in_lane2:
+            counted.append(det)
+
+    return counts_lane1, counts_lane2, counted
+
+
+def counts_vector(counts_lane1, counts_lane2):
+    """Flattens the lane counts into a list of 8 integers (lane 1 classes, then lane 2 classes)."""
+    keys = ("car", "bus", "truck", "motorcycle")
+    return [counts_lane1[k] for k in keys] + [counts_lane2[k] for k in keys]
+
+
+@profiling.timed("draw_overlay")
+def draw_overlay(frame, camera, detections, counted, counts_lane1, counts_lane2):
+    """
+    Draws the lane ROIs, the vehicle boxes and the lane counts onto a frame.
+
+    Parameters:
+        frame (numpy.ndarray): BGR frame, modified in place.
+        camera (dict): Camera configuration from CAMERAS.
+        detections (list): All detections of the frame.
+        counted (list): Detections counted in a lane (from count_lanes()).
+        counts_lane1 (dict): Vehicle counts of lane 1.
+        counts_lane2 (dict): Vehicle counts of lane 2.
+    """
+    lane1_polygon, lane2_polygon = camera["polygons"]
+    cv2.polylines(frame, [lane1_polygon], isClosed=True, color=(0, 255, 255), thickness=2)
+    cv2.polylines(frame, [lane2_polygon], isClosed=True, color=(255, 0, 255), thickness=2)
+
+    # Draw bounding box and label
+    boxes = [d for d in detections if d[4] in allowed_labels] if camera["draw_all"] else counted
+    for x1, y1, x2, y2, label in boxes:
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(frame, label, (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+    # Display vehicle counts on the frame
+    for i, (name, counts) in enumerate(zip(camera["lane_names"], (counts_lane1, counts_lane2))):
+        text = (f"{name} | Car: {counts['car']}  Bus: {counts['bus']}  "
+                f"Truck: {counts['truck']}  Motorcycle: {counts['motorcycle']}")
+        cv2.putText(frame, text, (10, 30 + 30 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
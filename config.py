@@ -0,0 +1,27 @@
+# config.py
+import argparse
+import json
+
+
+def parse_args_with_config(parser, argv=None):
+    """
+    Parses the command line with a --config option added to `parser`.
+
+    The JSON file given with --config holds default option values (keys are the
+    option names, e.g. {"com_port": "COM4"}); command line options take precedence.
+
+    Parameters:
+        parser (argparse.ArgumentParser): Parser with the script's own options.
+        argv (list): Arguments to parse (default: sys.argv[1:]).
+
+    Returns:
+        argparse.Namespace: The parsed options.
+    """
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument("--config")
+    known, _ = pre.parse_known_args(argv)
+    parser.add_argument("--config", help="JSON file with default option values")
+    if known.config:
+        with open(known.config) as f:
+            parser.set_defaults(**json.load(f))
+    return parser.parse_args(argv)
@@ -1,8 +1,18 @@
 # control.py
+import argparse
 import socket
 import json
+import math
+import os
+import signal
+import sys
+import threading
 import time
-import serial
+
+import profiling
+import tracing
+from config import parse_args_with_config
+from serial_protocol import SerialLink
 
 # --- Algorithm Parameters ---
 alpha = 0.4            # Smoothing factor for MA (Exponential Moving Average)
@@ -11,27 +21,47 @@ upper_threshold = 200  # Upper threshold
 T_min = 15             # Minimum green light duration (seconds)
 T_max = 45             # Maximum green light duration (seconds)
 yellowTime = 3         # Fixed yellow light duration (seconds)
+saturation_flow = 2.0  # Weighted vehicles per second an approach discharges when green (predictive mode)
 
-# Initial MA values for the East-West and North-South directions
-MA_eastwest = 0
-MA_northsouth = 0
-
-# Global variables for managing the data collection cycle
-cycle_records = []       # List to store per-second data records during a cycle
-cycle_active = False     # Flag indicating whether a data collection cycle is active
-computed_signals = None  # Stores the computed signals after sufficient data is collected
+# Controller modes: "ema" maps a moving average of the flow onto T_min..T_max,
+# "predictive" estimates queues and arrival rates and minimizes the predicted delay (predictive.py)
+CONTROLLER_MODES = ("ema", "predictive")
+controller_mode = "ema"  # Mode of intersections without an entry in intersection_modes
+intersection_modes = {}  # Intersection id -> controller mode
 
-# Store the initial red_time value for each direction
-start_red_time_eastwest = None
-start_red_time_northsouth = None
+# Samples without an "intersection" field belong to the default intersection,
+# which is also the one whose timers are sent to the Arduino
+DEFAULT_INTERSECTION = "default"
+arduino_intersection = DEFAULT_INTERSECTION
 
-# --- Additional variables to store computed values from the previous cycle ---
-last_computed_eastwest = 0
-last_computed_northsouth = 0
+# Controller state of each intersection: id -> Intersection
+intersections = {}
 
 # Global Serial object for communication with Arduino
 arduino_ser = None
 
+# Serial protocol: "ascii" sends "redTime,direction\n" lines; "binary" sends framed,
+# acknowledged TIMERS frames (see serial_protocol.py) carrying both directions at once
+serial_protocol = "ascii"
+arduino_link = None      # SerialLink used by the binary protocol
+pending_timers = {}      # Red times queued for the next flush: direction -> red_time
+arduino_connecting = False  # True while the port is opened in the background
+arduino_disabled = False    # True when running without an Arduino on purpose (--no-serial, no port)
+
+# Latest counts pushed by the camera scripts in headless mode:
+# (intersection, direction) -> (counts, receive time)
+camera_counts = {}
+camera_max_age = 3.0     # Camera counts older than this (seconds) are ignored
+# Traces of the latest camera samples not yet used by a timing sample:
+# (intersection, camera) -> (trace, receive time)
+camera_traces = {}
+
+# Serializes access to the controller state between client connection threads
+state_lock = threading.Lock()
+
+# Print every record and computed signal (disable with --quiet for high-rate runs)
+verbose = True
+
 def send_to_arduino(red_time, direction):
     """
     Sends data to Arduino in the format "redTime,direction\n"
@@ -43,168 +73,809 @@ def send_to_arduino(red_time, direction):
     
     Note:
         This function requires an active serial connection with the Arduino.
+        With the binary protocol, or while the port is still being opened, the
+        command is queued and sent by flush_arduino().
     """
     global arduino_ser
     if arduino_ser is None:
-        print("Arduino connection not open.")
+        if arduino_connecting:
+            # Keep only the latest value per direction until the Arduino is ready
+            pending_timers[direction] = red_time
+        elif not arduino_disabled:
+            print("Arduino connection not open.")
+        return
+    if serial_protocol == "binary":
+        pending_timers[direction] = red_time
         return
+    write_ascii(red_time, direction)
+
+
+def write_ascii(red_time, direction):
+    """Writes one ASCII "redTime,direction\n" command to the Arduino."""
     cmd = f"{red_time},{direction}\n"
     try:
         arduino_ser.write(cmd.encode('utf-8'))
+        tracing.stamp_current("serial")
         print("Sent command to Arduino:", cmd.strip())
     except Exception as e:
         print("Error sending data to Arduino:", e)
-    
+
+
+def flush_arduino():
+    """
+    Sends the red times queued by send_to_arduino().
+
+    With the binary protocol, both directions go out in one frame. Commands queued
+    while the port was being opened are written once the Arduino is ready.
+    """
+    if not pending_timers or arduino_ser is None:
+        return
+    ew = pending_timers.pop("EW", None)
+    ns = pending_timers.pop("NS", None)
+    pending_timers.clear()
+    if serial_protocol != "binary":
+        for red_time, direction in ((ew, "EW"), (ns, "NS")):
+            if red_time is not None:
+                write_ascii(red_time, direction)
+        return
+    if arduino_link is None:
+        return
+    try:
+        seq = arduino_link.send_timers(ew=ew, ns=ns)
+        tracing.stamp_current("serial")
+        print(f"Sent frame {seq} to Arduino: EW={ew}, NS={ns}")
+    except Exception as e:
+        print("Error sending data to Arduino:", e)
+
+
+def wait_for_ready(ser, timeout):
+    """
+    Waits for the "READY" line the Arduino prints at the end of setup().
+
+    Parameters:
+        ser (serial.Serial): The open serial port (with a short read timeout).
+        timeout (float): Maximum time to wait (seconds).
+
+    Returns:
+        bool: True if READY was received, False on timeout (e.g. an older sketch).
+    """
+    deadline = time.monotonic() + timeout
+    buffer = b""
+    while time.monotonic() < deadline:
+        buffer += ser.read(ser.in_waiting or 1)
+        if b"READY" in buffer:
+            return True
+        buffer = buffer[-16:]
+    return False
+
+
+def connect_arduino(com_port, baud_rate, ready_timeout):
+    """
+    Opens the Arduino port and waits for the board to be ready, off the main thread.
+
+    Opening the port resets the Arduino. Instead of a fixed sleep, this waits for
+    the sketch's READY line (or `ready_timeout`), while the server already accepts
+    connections. Commands produced meanwhile are queued and flushed once ready.
+    """
+    global arduino_ser, arduino_link, arduino_connecting
+    try:
+        import serial
+
+        ser = serial.Serial(com_port, baud_rate, timeout=0.1)
+        start = time.monotonic()
+        ready = wait_for_ready(ser, ready_timeout)
+        waited = time.monotonic() - start
+        link = None
+        if serial_protocol == "binary":
+            ser.timeout = 0.05  # Short reads so that missing ACKs are noticed quickly
+            link = SerialLink(ser)
+        with state_lock:
+            arduino_ser = ser
+            arduino_link = link
+            arduino_connecting = False
+            flush_arduino()
+        if ready:
+            print(f"Successfully connected to Arduino on {com_port} (ready after {waited:.2f}s)")
+        else:
+            print(f"Connected to Arduino on {com_port} (no READY after {waited:.1f}s, assuming ready)")
+    except Exception as e:
+        print("Unable to open Arduino port", com_port, ":", e)
+        # Continue running the server without sending commands to Arduino
+        with state_lock:
+            arduino_connecting = False
+            pending_timers.clear()
+
+
+def valid_counts(counts):
+    """Tells whether the counts of one direction are a dict of finite numbers, e.g. {"car": 3, "bus": 1}."""
+    return isinstance(counts, dict) and all(
+        not isinstance(n, bool) and isinstance(n, (int, float)) and math.isfinite(n) for n in counts.values())
+
+
+def sample_error(data):
+    """
+    Checks a timing sample before it changes any state.
+
+    Returns:
+        str: What is wrong with the sample, or None if it is valid.
+    """
+    if not isinstance(data.get("intersection", DEFAULT_INTERSECTION), str):
+        return "'intersection' must be a string."
+    for key in ("red_time_eastwest", "red_time_northsouth"):
+        value = data.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int)):
+            return f"{key!r} must be an integer."
+    for direction in ("east", "west", "north", "south"):
+        if direction in data and not valid_counts(data[direction]):
+            return f"{direction!r} must map vehicle types to numbers."
+    return None
+
+
+def update_camera_counts(data, trace=None):
+    """
+    Stores the per-direction counts of a camera sample.
+
+    Camera samples carry no red_time values; they only provide the counts for the
+    directions the camera covers (e.g. "east" and "west" for EWcamera.py).
+
+    Parameters:
+        data (dict): Camera sample, e.g. {"source": "camera", "camera": "EW", "east": {...}, "west": {...}}.
+        trace (dict): Trace of the sample, completed by the timing sample that uses the counts.
+    """
+    now = time.monotonic()
+    intersection = data.get("intersection", DEFAULT_INTERSECTION)
+    if not isinstance(intersection, str):
+        return
+    for direction in ("east", "west", "north", "south"):
+        counts = data.get(direction)
+        if valid_counts(counts):
+            camera_counts[(intersection, direction)] = (counts, now)
+    if trace is not None:
+        camera_traces[(intersection, data.get("camera"))] = (trace, now)
+
+
+def merge_camera_counts(data):
+    """
+    Replaces the counts of a timing sample with recent camera counts.
+
+    Directions without a camera sample for the same intersection newer than
+    `camera_max_age` keep the counts of the incoming data.
+
+    Parameters:
+        data (dict): Incoming JSON data containing red_time values and traffic counts.
+
+    Returns:
+        dict: The data with camera counts merged in.
+    """
+    if not camera_counts:
+        return data
+    now = time.monotonic()
+    intersection = data.get("intersection", DEFAULT_INTERSECTION)
+    merged = dict(data)
+    for (source, direction), (counts, received) in camera_counts.items():
+        if source == intersection and now - received <= camera_max_age:
+            merged[direction] = counts
+    return merged
+
+
+def take_camera_traces(intersection):
+    """Removes and returns the traces of the camera samples merged into the next sample of an intersection."""
+    now = time.monotonic()
+    taken = []
+    for key in [key for key in camera_traces if key[0] == intersection]:
+        trace, received = camera_traces.pop(key)
+        if now - received <= camera_max_age:
+            taken.append(trace)
+    return taken
+
+
+def process_sample(conn, data, trace=None):
+    """
+    Processes a timing sample with the camera counts merged in and sends the
+    resulting Arduino commands, under the state lock.
+
+    With tracing enabled, the trace of the sample gets the "lock", "serial" and
+    "done" stamps and is written out, together with the traces of the camera
+    samples whose counts were used.
+
+    Parameters:
+        conn (socket.socket): The client connection (None for the state bus).
+        data (dict): The timing sample.
+        trace (dict): Trace of the sample (None when tracing is disabled).
+
+    Returns:
+        dict: The result of process_data(), or {"status": "ignored", "message": ...}
+              for an invalid sample (see sample_error()), which changes no state.
+    """
+    error = sample_error(data)
+    if error is not None:
+        return {"status": "ignored", "message": error}
+    intersection = data.get("intersection", DEFAULT_INTERSECTION)
+    cameras = ()
+    with state_lock:
+        tracing.stamp(trace, "lock")
+        tracing.activate(trace)
+        try:
+            result = process_data(conn, merge_camera_counts(data))
+            flush_arduino()
+        finally:
+            tracing.activate(None)
+        if trace is not None and camera_traces:
+            cameras = take_camera_traces(intersection)
+    if trace is not None:
+        tracing.stamp(trace, "done")
+        tracing.record(trace, intersection=intersection)
+        # Camera counts enter the decision when the timing sample takes the lock
+        stamps = trace["stamps"]
+        lock = next(i for i, (hop, _) in enumerate(stamps) if hop == "lock")
+        for camera_trace in cameras:
+            camera_trace["stamps"].append(["merge", stamps[lock][1]])
+            camera_trace["stamps"].extend(stamps[lock + 1:])
+            tracing.record(camera_trace, intersection=intersection, merged_into=trace["id"])
+    return result
+
+
+def decode_messages(buffer):
+    """
+    Decodes all complete JSON objects from a receive buffer.
+
+    Messages may be newline-delimited (persistent clients such as the camera
+    scripts and simulation.py) or a single object without a terminator
+    (one-shot clients).
+
+    Parameters:
+        buffer (str): Received text that has not been decoded yet.
+
+    Returns:
+        tuple: (list of decoded objects, remaining undecoded text)
+    """
+    decoder = json.JSONDecoder()
+    messages = []
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos >= len(buffer):
+            return messages, ""
+        try:
+            obj, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            end = buffer.find("\n", pos)
+            if end < 0:
+                # Incomplete message: wait for more data
+                return messages, buffer[pos:]
+            # A complete but malformed line: skip it
+            print("Error decoding JSON:", e)
+            pos = end + 1
+            continue
+        messages.append(obj)
+
+
+class Intersection:
+    """
+    Controller state of one intersection.
+
+    Parameters:
+        name (str): Intersection id (the "intersection" field of the samples).
+        mode (str): Controller mode, one of CONTROLLER_MODES.
+        arduino (bool): Send the red times of this intersection to the Arduino.
+        verbose (bool): Print every record and computed signal.
+    """
+
+    def __init__(self, name=DEFAULT_INTERSECTION, mode="ema", arduino=False, verbose=True):
+        if mode not in CONTROLLER_MODES:
+            raise ValueError(f"Unknown controller mode {mode!r}; choose from {', '.join(CONTROLLER_MODES)}")
+        self.name = name
+        self.mode = mode
+        self.arduino = arduino
+        self.verbose = verbose
+
+        # Initial MA values for the East-West and North-South directions
+        self.MA_eastwest = 0
+        self.MA_northsouth = 0
+
+        # Variables for managing the data collection cycle
+        self.cycle_records = []       # List to store per-second data records during a cycle
+        self.cycle_active = False     # Flag indicating whether a data collection cycle is active
+        self.computed_signals = None  # Stores the computed signals after sufficient data is collected
+
+        # Store the initial red_time value for each direction
+        self.start_red_time_eastwest = None
+        self.start_red_time_northsouth = None
+
+        # --- Additional variables to store computed values from the previous cycle ---
+        self.last_computed_eastwest = 0
+        self.last_computed_northsouth = 0
+
+        # Red times of the last sample: clients that push updates on every change may
+        # send several samples within one second of the countdown
+        self.last_red = None
+
+        # Recent samples and cycle results, queried by dashboards (see handle_query())
+        from history import History
+
+        self.history = History()
+        self.cycle_start_time = None
+
+        # Queue and arrival-rate estimator of the predictive mode
+        self.predictor = None
+        if mode == "predictive":
+            from predictive import PredictiveController
+
+            self.predictor = PredictiveController(T_min, T_max, yellowTime, saturation_flow)
+
+    def log(self, *args):
+        if self.verbose:
+            print(*args)
+
+    # Controller state saved in checkpoints (the history is not saved)
+    STATE_FIELDS = ("MA_eastwest", "MA_northsouth", "cycle_records", "cycle_active", "computed_signals",
+                    "start_red_time_eastwest", "start_red_time_northsouth",
+                    "last_computed_eastwest", "last_computed_northsouth", "cycle_start_time")
+    CYCLE_FIELDS = ("cycle_records", "cycle_active", "start_red_time_eastwest",
+                    "start_red_time_northsouth", "cycle_start_time")
+
+    def get_state(self):
+        """Returns the controller state as a JSON-serializable dict."""
+        state = {name: getattr(self, name) for name in self.STATE_FIELDS}
+        state["cycle_records"] = list(self.cycle_records)
+        state["mode"] = self.mode
+        if self.predictor is not None:
+            state["predictor"] = self.predictor.get_state()
+        return state
+
+    def set_state(self, state, resume_cycle=True):
+        """
+        Restores a state saved by get_state().
+
+        Parameters:
+            state (dict): The saved state.
+            resume_cycle (bool): Also restore the active cycle; otherwise only the
+                                 moving averages and the values of the last cycle.
+        """
+        for name in self.STATE_FIELDS:
+            if name in state and (resume_cycle or name not in self.CYCLE_FIELDS):
+                setattr(self, name, state[name])
+        if self.predictor is not None and state.get("predictor"):
+            self.predictor.set_state(state["predictor"])
+
+    def send(self, red_time, direction):
+        if self.arduino:
+            send_to_arduino(red_time, direction)
+
+    def process(self, data):
+        """
+        Processes one sample of this intersection.
+
+        The function performs the following tasks:
+          - Validates the input data.
+          - Initiates a new data collection cycle when the red_time threshold is met.
+          - Records each data entry and sends a countdown command to Arduino.
+            A sample repeating the red times of the previous one replaces its record
+            (newer counts for the same second) and sends nothing.
+          - Once red_time reaches 1, it computes the traffic signals (see green_times()).
+          - Resets the cycle after computation.
+
+        Parameters:
+            data (dict): Incoming JSON data containing red_time values and traffic counts.
+
+        Returns:
+            dict: A dictionary indicating the status and message or the computed signals.
+        """
+        red_time_eastwest = data.get("red_time_eastwest")
+        red_time_northsouth = data.get("red_time_northsouth")
+
+        if red_time_eastwest is None or red_time_northsouth is None:
+            self.log("Invalid data: missing red_time for one of the directions.")
+            return {"status": "ignored", "message": "Missing red_time data."}
+
+        threshold = 15  # Minimum threshold to start a cycle
+        starts_cycle = not self.cycle_active and (red_time_eastwest >= threshold or red_time_northsouth >= threshold)
+
+        repeat = (red_time_eastwest, red_time_northsouth) == self.last_red
+        self.last_red = (red_time_eastwest, red_time_northsouth)
+        if starts_cycle:
+            # The sample starting a cycle counts towards its mean flows
+            self.history.begin_cycle()
+        if not repeat:
+            self.history.add_sample(data)
+        if self.predictor is not None:
+            # The queue estimates follow every sample, not only the recorded ones
+            self.predictor.observe(data)
+
+        # --- Start a New Cycle ---
+        if starts_cycle:
+            self.cycle_active = True
+            # If a computed value exists from the previous cycle and is above threshold, use it.
+            self.start_red_time_eastwest = self.last_computed_eastwest if self.last_computed_eastwest >= threshold \
+                                                                       else (red_time_eastwest if red_time_eastwest >= threshold else 0)
+            self.start_red_time_northsouth = self.last_computed_northsouth if self.last_computed_northsouth >= threshold \
+                                                                           else (red_time_northsouth if red_time_northsouth >= threshold else 0)
+
+            # Reset computed values after using them
+            self.last_computed_eastwest = 0
+            self.last_computed_northsouth = 0
+
+            self.cycle_records = []
+            self.cycle_records.append(data)
+            self.cycle_start_time = time.time()
+
+            self.log(f"\nRecord 1: start_red_time_eastwest={self.start_red_time_eastwest}, start_red_time_northsouth={self.start_red_time_northsouth}")
+
+            if self.start_red_time_eastwest >= threshold:
+                self.send(self.start_red_time_eastwest, "EW")
+            if self.start_red_time_northsouth >= threshold:
+                self.send(self.start_red_time_northsouth, "NS")
+
+            return {"status": "recording", "message": "Recorded first entry."}
+
+        # --- Continue Recording Data ---
+        if self.cycle_active and repeat and self.cycle_records:
+            self.cycle_records[-1] = data
+            return {"status": "recording", "message": f"Updated entry {len(self.cycle_records)}."}
+        if self.cycle_active:
+            # Record data if the active direction (with red_time > 0) is within the range from the initial value down to 1.
+            cond_EW = (self.start_red_time_eastwest != 0 and red_time_eastwest >= 1
+                       and red_time_eastwest <= self.start_red_time_eastwest and red_time_eastwest >= 1)
+            cond_NS = (self.start_red_time_northsouth != 0 and red_time_northsouth >= 1
+                       and red_time_northsouth <= self.start_red_time_northsouth and red_time_northsouth >= 1)
+
+            if cond_EW or cond_NS:
+                self.cycle_records.append(data)
+                record_num = len(self.cycle_records)
+                self.log(f"Record {record_num}: red_time_eastwest={red_time_eastwest}, red_time_northsouth={red_time_northsouth}")
+
+                # For each record, send a countdown command to Arduino.
+                if cond_EW:
+                    self.send(red_time_eastwest, "EW")
+                elif cond_NS:
+                    self.send(red_time_northsouth, "NS")
+
+                # When red_time reaches 1, record the final entry and compute the signals.
+                if (cond_EW and red_time_eastwest == 1) or (cond_NS and red_time_northsouth == 1):
+                    served = "EW" if cond_EW else "NS"
+                    green_eastwest, green_northsouth = self.green_times(served)
+                    if self.predictor is not None:
+                        estimates = (self.predictor.queue["EW"], self.predictor.queue["NS"])
+                    else:
+                        estimates = (self.MA_eastwest, self.MA_northsouth)
+                    self.history.add_cycle(self.cycle_start_time, served, estimates,
+                                           green_eastwest if cond_EW else green_northsouth)
+
+                    # Only send signals for the direction that is currently in a red state:
+                    if cond_EW:
+                        self.computed_signals = {
+                            "eastwest_green": green_eastwest,
+                            "northsouth_red": green_eastwest + yellowTime
+                        }
+                        # Since North-South is red, update its new red time for the next cycle.
+                        self.last_computed_northsouth = self.computed_signals["northsouth_red"]
+                        self.log("Computed signals:", self.computed_signals)
+                    elif cond_NS:
+                        self.computed_signals = {
+                            "northsouth_green": green_northsouth,
+                            "eastwest_red": green_northsouth + yellowTime
+                        }
+                        # Since East-West is red, update its new red time for the next cycle.
+                        self.last_computed_eastwest = self.computed_signals["eastwest_red"]
+                        self.log("Computed signals:", self.computed_signals)
+
+                    # Reset the cycle immediately after computation
+                    self.cycle_active = False
+                    self.cycle_records = []
+                    self.start_red_time_eastwest = 0
+                    self.start_red_time_northsouth = 0
+
+                    return self.computed_signals
+                else:
+                    return {"status": "recording", "message": f"Recorded entry {record_num}."}
+
+        self.log("No action taken.")
+        return {"status": "waiting", "red_time_eastwest": red_time_eastwest, "red_time_northsouth": red_time_northsouth}
+
+    def green_times(self, served):
+        """
+        Computes the green times at the end of a cycle.
+
+        Parameters:
+            served (str): The direction whose red phase is ending ("EW" or "NS").
+
+        Returns:
+            tuple: (green_eastwest, green_northsouth) in seconds.
+        """
+        if self.predictor is not None:
+            green = self.predictor.green_time(served)
+            self.log(f"Predicted queues = {self.predictor.queue}, arrival rates = {self.predictor.rate}")
+            return green, green
+
+        # Calculate total traffic flow using weights (illustrative example)
+        # Define weight factors for different vehicle types.
+        weights = {'car': 1, 'bus': 2, 'truck': 3, 'motorcycle': 0.5}
+        total_flow_east = total_flow_west = total_flow_north = total_flow_south = 0
+
+        for record in self.cycle_records:
+            total_flow_east += sum(weights[k] * record.get('east', {}).get(k, 0) for k in weights)
+            total_flow_west += sum(weights[k] * record.get('west', {}).get(k, 0) for k in weights)
+            total_flow_north += sum(weights[k] * record.get('north', {}).get(k, 0) for k in weights)
+            total_flow_south += sum(weights[k] * record.get('south', {}).get(k, 0) for k in weights)
+
+        num_records = len(self.cycle_records)  # Total number of records collected
+        flow_rate_east  = total_flow_east  / num_records if num_records > 0 else 0
+        flow_rate_west  = total_flow_west  / num_records if num_records > 0 else 0
+        flow_rate_north = total_flow_north / num_records if num_records > 0 else 0
+        flow_rate_south = total_flow_south / num_records if num_records > 0 else 0
+
+        flow_eastwest = flow_rate_east + flow_rate_west
+        flow_northsouth = flow_rate_north + flow_rate_south
+
+        # Update the MA values with the new flow rates
+        self.MA_eastwest = alpha * flow_eastwest + (1 - alpha) * self.MA_eastwest
+        self.MA_northsouth = alpha * flow_northsouth + (1 - alpha) * self.MA_northsouth
+
+        # Clamp the MA values between lower and upper thresholds
+        effective_eastwest = max(lower_threshold, min(self.MA_eastwest, upper_threshold))
+        effective_northsouth = max(lower_threshold, min(self.MA_northsouth, upper_threshold))
+
+        # Print MA and effective values for debugging
+        self.log(f"MA_eastwest = {self.MA_eastwest}, MA_northsouth = {self.MA_northsouth}")
+        self.log(f"effective_eastwest = {effective_eastwest}, effective_northsouth = {effective_northsouth}")
+
+        total_effective = effective_eastwest + effective_northsouth
+        if total_effective == 0:
+            green_eastwest = T_min
+            green_northsouth = T_min
+        else:
+            green_eastwest = T_min + (T_max - T_min) * ((effective_eastwest - lower_threshold) / (upper_threshold - lower_threshold))
+            green_northsouth = T_min + (T_max - T_min) * ((effective_northsouth - lower_threshold) / (upper_threshold - lower_threshold))
+
+        green_eastwest = max(T_min, min(int(round(green_eastwest)), T_max))
+        green_northsouth = max(T_min, min(int(round(green_northsouth)), T_max))
+        return green_eastwest, green_northsouth
+
+
+def get_intersection(name):
+    """Returns the controller state of an intersection, creating it on first use."""
+    intersection = intersections.get(name)
+    if intersection is None:
+        mode = intersection_modes.get(name, controller_mode)
+        intersection = Intersection(name, mode, arduino=(name == arduino_intersection), verbose=verbose)
+        intersections[name] = intersection
+        print(f"New intersection {name!r} ({mode} controller)")
+    return intersection
+
+
+@profiling.timed("process_data")
 def process_data(conn, data):
     """
     Processes incoming data from the socket connection.
-    
-    The function performs the following tasks:
-      - Validates the input data.
-      - Initiates a new data collection cycle when the red_time threshold is met.
-      - Records each data entry and sends a countdown command to Arduino.
-      - Once red_time reaches 1, it computes the traffic signals based on weighted traffic flows.
-      - Resets the cycle after computation.
-    
+
+    The sample is handled by the controller state of its intersection (the
+    "intersection" field, DEFAULT_INTERSECTION if absent); see Intersection.process().
+
     Parameters:
         conn (socket.socket): The socket connection object.
         data (dict): Incoming JSON data containing red_time values and traffic counts.
-    
+
     Returns:
         dict: A dictionary indicating the status and message or the computed signals.
     """
-    global cycle_records, cycle_active, computed_signals, MA_eastwest, MA_northsouth
-    global start_red_time_eastwest, start_red_time_northsouth
-    global last_computed_eastwest, last_computed_northsouth
-
-    red_time_eastwest = data.get("red_time_eastwest")
-    red_time_northsouth = data.get("red_time_northsouth")
-
-    if red_time_eastwest is None or red_time_northsouth is None:
-        print("Invalid data: missing red_time for one of the directions.")
-        return {"status": "ignored", "message": "Missing red_time data."}
-
-    threshold = 15  # Minimum threshold to start a cycle
-
-    # --- Start a New Cycle ---
-    if not cycle_active and (red_time_eastwest >= threshold or red_time_northsouth >= threshold):
-        cycle_active = True
-        # If a computed value exists from the previous cycle and is above threshold, use it.
-        start_red_time_eastwest = last_computed_eastwest if last_computed_eastwest >= threshold \
-                                                         else (red_time_eastwest if red_time_eastwest >= threshold else 0)
-        start_red_time_northsouth = last_computed_northsouth if last_computed_northsouth >= threshold \
-                                                             else (red_time_northsouth if red_time_northsouth >= threshold else 0)
-        
-        # Reset computed values after using them
-        last_computed_eastwest = 0
-        last_computed_northsouth = 0
-        
-        cycle_records = []
-        cycle_records.append(data)
-        
-        print(f"\nRecord 1: start_red_time_eastwest={start_red_time_eastwest}, start_red_time_northsouth={start_red_time_northsouth}")
-
-        if start_red_time_eastwest >= threshold:
-            send_to_arduino(start_red_time_eastwest, "EW")
-        if start_red_time_northsouth >= threshold:
-            send_to_arduino(start_red_time_northsouth, "NS")
-
-        return {"status": "recording", "message": "Recorded first entry."}
-
-    # --- Continue Recording Data ---
-    if cycle_active:
-        # Record data if the active direction (with red_time > 0) is within the range from the initial value down to 1.
-        cond_EW = (start_red_time_eastwest != 0 and red_time_eastwest >= 1 
-                   and red_time_eastwest <= start_red_time_eastwest and red_time_eastwest >= 1)
-        cond_NS = (start_red_time_northsouth != 0 and red_time_northsouth >= 1 
-                   and red_time_northsouth <= start_red_time_northsouth and red_time_northsouth >= 1)
-        
-        if cond_EW or cond_NS:
-            cycle_records.append(data)
-            record_num = len(cycle_records)
-            print(f"Record {record_num}: red_time_eastwest={red_time_eastwest}, red_time_northsouth={red_time_northsouth}")
-            
-            # For each record, send a countdown command to Arduino.
-            if cond_EW:
-                send_to_arduino(red_time_eastwest, "EW")
-            elif cond_NS:
-                send_to_arduino(red_time_northsouth, "NS")
-            
-            # When red_time reaches 1, record the final entry and compute the signals.
-            if (cond_EW and red_time_eastwest == 1) or (cond_NS and red_time_northsouth == 1):
-                # Calculate total traffic flow using weights (illustrative example)
-                # Define weight factors for different vehicle types.
-                weights = {'car': 1, 'bus': 2, 'truck': 3, 'motorcycle': 0.5}
-                total_flow_east = total_flow_west = total_flow_north = total_flow_south = 0
-
-                for record in cycle_records:
-                    total_flow_east += sum(weights[k] * record.get('east', {}).get(k, 0) for k in weights)
-                    total_flow_west += sum(weights[k] * record.get('west', {}).get(k, 0) for k in weights)
-                    total_flow_north += sum(weights[k] * record.get('north', {}).get(k, 0) for k in weights)
-                    total_flow_south += sum(weights[k] * record.get('south', {}).get(k, 0) for k in weights)
-                    
-                num_records = len(cycle_records)  # Total number of records collected
-                flow_rate_east  = total_flow_east  / num_records if num_records > 0 else 0
-                flow_rate_west  = total_flow_west  / num_records if num_records > 0 else 0
-                flow_rate_north = total_flow_north / num_records if num_records > 0 else 0
-                flow_rate_south = total_flow_south / num_records if num_records > 0 else 0
-
-                flow_eastwest = flow_rate_east + flow_rate_west
-                flow_northsouth = flow_rate_north + flow_rate_south
-
-                # Update the MA values with the new flow rates
-                MA_eastwest = alpha * flow_eastwest + (1 - alpha) * MA_eastwest
-                MA_northsouth = alpha * flow_northsouth + (1 - alpha) * MA_northsouth
-
-                # Clamp the MA values between lower and upper thresholds
-                effective_eastwest = max(lower_threshold, min(MA_eastwest, upper_threshold))
-                effective_northsouth = max(lower_threshold, min(MA_northsouth, upper_threshold))
-                
-                # Print MA and effective values for debugging
-                print(f"MA_eastwest = {MA_eastwest}, MA_northsouth = {MA_northsouth}")
-                print(f"effective_eastwest = {effective_eastwest}, effective_northsouth = {effective_northsouth}")
-
-                total_effective = effective_eastwest + effective_northsouth
-                if total_effective == 0:
-                    green_eastwest = T_min
-                    green_northsouth = T_min
+    return get_intersection(data.get("intersection", DEFAULT_INTERSECTION)).process(data)
+
+
+def save_checkpoint(path, last=None):
+    """
+    Atomically writes the state of all intersections to `path`.
+
+    The snapshot is written to a temporary file, flushed to disk and renamed over
+    the previous one, so a crash leaves either the old or the new snapshot.
+
+    Parameters:
+        path (str): Checkpoint file.
+        last (str): Content of the previous snapshot; nothing is written if unchanged.
+
+    Returns:
+        str: The content of the snapshot.
+    """
+    with state_lock:
+        states = {name: intersection.get_state() for name, intersection in intersections.items()}
+    content = json.dumps(states, separators=(",", ":"), sort_keys=True)
+    if content == last:
+        return content
+    snapshot = '{"version":1,"saved_at":%r,"intersections":%s}' % (time.time(), content)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(snapshot)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if os.name != "nt":
+        # Make the rename itself durable
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    return content
+
+
+def load_checkpoint(path, max_cycle_age):
+    """
+    Restores the intersections saved by save_checkpoint().
+
+    Active cycles are only resumed if the snapshot is at most `max_cycle_age`
+    seconds old; older snapshots restore the moving averages and last computed
+    values, and the next cycle starts from fresh samples.
+
+    Returns:
+        int: Number of restored intersections (0 if there is no usable checkpoint).
+    """
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError) as e:
+        print("Ignoring unreadable checkpoint", path, ":", e)
+        return 0
+    age = time.time() - snapshot.get("saved_at", 0)
+    resume_cycle = age <= max_cycle_age
+    with state_lock:
+        for name, state in snapshot.get("intersections", {}).items():
+            get_intersection(name).set_state(state, resume_cycle)
+    restored = len(snapshot.get("intersections", {}))
+    print(f"Restored {restored} intersection(s) from {path} (saved {age:.1f}s ago"
+          f"{'' if resume_cycle else ', active cycles dropped'})")
+    return restored
+
+
+def checkpoint_loop(path, interval, stop):
+    """Saves a checkpoint every `interval` seconds until `stop` is set."""
+    last = None
+    while not stop.wait(interval):
+        try:
+            last = save_checkpoint(path, last)
+        except OSError as e:
+            print("Error writing checkpoint", path, ":", e)
+
+
+def handle_query(request):
+    """
+    Answers a read-only query from a dashboard; the controller state is not locked.
+
+    Queries:
+      - {"query": "intersections"}: the known intersections and their controller modes.
+      - {"query": "history", "intersection": "default", "kind": "samples" or "cycles",
+         "start": t0, "end": t1, "last": seconds, "bins": n}: aggregates of the
+        per-second samples or the cycle results over a time range (see History.query());
+        "last" selects the most recent seconds instead of start/end.
+
+    Parameters:
+        request (dict): The query message.
+
+    Returns:
+        dict: The query result, or {"status": "error", "message": ...}.
+    """
+    query = request.get("query")
+    if query == "intersections":
+        return {"status": "ok", "intersections": {name: i.mode for name, i in list(intersections.items())}}
+    if query != "history":
+        return {"status": "error", "message": f"Unknown query {query!r}."}
+    name = request.get("intersection", DEFAULT_INTERSECTION)
+    intersection = intersections.get(name)
+    if intersection is None:
+        return {"status": "error", "message": f"Unknown intersection {name!r}."}
+    for key in ("start", "end", "last", "bins"):
+        value = request.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                  or not math.isfinite(value)):
+            return {"status": "error", "message": f"{key!r} must be a finite number."}
+    bins = request.get("bins")
+    if bins is not None and (bins != int(bins) or not 0 < bins <= 1000):
+        return {"status": "error", "message": "'bins' must be an integer from 1 to 1000."}
+    end = request.get("end")
+    start = request.get("start")
+    if request.get("last") is not None:
+        end = time.time()
+        start = end - request["last"]
+    try:
+        result = intersection.history.query(request.get("kind", "samples"), start, end,
+                                            None if bins is None else int(bins))
+    except (TypeError, ValueError) as e:
+        return {"status": "error", "message": str(e)}
+    result["status"] = "ok"
+    result["intersection"] = name
+    return result
+
+
+def handle_client(conn, addr):
+    """
+    Serves one client connection until the client closes it.
+
+    A connection may carry any number of messages:
+      - Camera samples ("source": "camera") update the camera counts and get no reply.
+      - Queries ("query": ...) are answered from the history (see handle_query()).
+      - Timing samples are processed by process_data() and answered with the result.
+
+    Parameters:
+        conn (socket.socket): The client connection.
+        addr (tuple): The client address.
+    """
+    buffer = ""
+    with conn:
+        while True:
+            try:
+                chunk = conn.recv(4096)
+            except OSError as e:
+                print("Connection error from", addr, ":", e)
+                break
+            if not chunk:
+                break
+            received = tracing.now() if tracing.ENABLED else None
+            buffer += chunk.decode(errors="replace")
+            messages, buffer = decode_messages(buffer)
+            if len(buffer) > 65536:
+                print("Discarding oversized message from", addr)
+                buffer = ""
+            for vehicle_data in messages:
+                if not isinstance(vehicle_data, dict):
+                    print("Error decoding JSON: expected an object")
+                    continue
+                trace = tracing.received(vehicle_data.pop("trace", None), "tcp", received)
+                if vehicle_data.get("source") == "camera":
+                    with state_lock:
+                        update_camera_counts(vehicle_data, trace)
+                    continue
+                if "query" in vehicle_data:
+                    result = handle_query(vehicle_data)
                 else:
-                    green_eastwest = T_min + (T_max - T_min) * ((effective_eastwest - lower_threshold) / (upper_threshold - lower_threshold))
-                    green_northsouth = T_min + (T_max - T_min) * ((effective_northsouth - lower_threshold) / (upper_threshold - lower_threshold))
+                    result = process_sample(conn, vehicle_data, trace)
+                response = json.dumps(result, ensure_ascii=False) + "\n"
+                try:
+                    conn.sendall(response.encode())
+                except OSError as e:
+                    print("Error sending response to", addr, ":", e)
+                    return
 
-                green_eastwest = max(T_min, min(int(round(green_eastwest)), T_max))
-                green_northsouth = max(T_min, min(int(round(green_northsouth)), T_max))
 
-                # Only send signals for the direction that is currently in a red state:
-                if cond_EW:
-                    computed_signals = {
-                        "eastwest_green": green_eastwest,
-                        "northsouth_red": green_eastwest + yellowTime
-                    }
-                    # Since North-South is red, update its new red time for the next cycle.
-                    last_computed_northsouth = computed_signals["northsouth_red"]
-                    print("Computed signals:", computed_signals)
-                elif cond_NS:
-                    computed_signals = {
-                        "northsouth_green": green_northsouth,
-                        "eastwest_red": green_northsouth + yellowTime
-                    }
-                    # Since East-West is red, update its new red time for the next cycle.
-                    last_computed_eastwest = computed_signals["eastwest_red"]
-                    print("Computed signals:", computed_signals)
-
-                # Reset the cycle immediately after computation
-                cycle_active = False
-                cycle_records = []
-                start_red_time_eastwest = 0
-                start_red_time_northsouth = 0
-                
-                return computed_signals
-            else:
-                return {"status": "recording", "message": f"Recorded entry {record_num}."}
-    
-    print("No action taken.")
-    return {"status": "waiting", "red_time_eastwest": red_time_eastwest, "red_time_northsouth": red_time_northsouth}
+def handle_bus_sample(data):
+    """Processes one sample received on the shared-memory state bus (see state_bus.py)."""
+    return process_sample(None, data, tracing.start("bus", "receive"))
+
+
+def parse_args(argv=None):
+    """
+    Parses the command line. Options can also come from a JSON config file given
+    with --config (keys are the option names, e.g. {"com_port": "COM4"});
+    command line options take precedence.
+    """
+    parser = argparse.ArgumentParser(description="Traffic light controller")
+    parser.add_argument("--host", default="localhost", help="Address the TCP server listens on")
+    parser.add_argument("--port", type=int, default=12345, help="Port the TCP server listens on")
+    parser.add_argument("--com-port", help="Arduino serial port (e.g. COM4 or /dev/ttyUSB0)")
+    parser.add_argument("--baud", type=int, default=9600, help="Arduino baud rate")
+    parser.add_argument("--no-serial", action="store_true", help="Run without an Arduino")
+    parser.add_argument("--ready-timeout", type=float, default=3.0,
+                        help="Seconds to wait for the Arduino's READY line after opening the port")
+    parser.add_argument("--protocol", choices=("ascii", "binary"), default="ascii",
+                        help="Serial protocol used to talk to the Arduino")
+    parser.add_argument("--controller", choices=CONTROLLER_MODES, default="ema",
+                        help="Controller mode of intersections not listed with --intersection")
+    parser.add_argument("--intersection", action="append", default=[], metavar="ID=MODE",
+                        help="Controller mode of one intersection, e.g. north_gate=predictive (repeatable)")
+    parser.add_argument("--saturation-flow", type=float, default=saturation_flow,
+                        help="Weighted vehicles per second an approach discharges when green (predictive mode)")
+    parser.add_argument("--bus", metavar="NAME",
+                        help="Also serve same-host clients on a shared-memory state bus with this name")
+    parser.add_argument("--bus-slots", type=int, default=64, help="Intersection slots of the state bus")
+    parser.add_argument("--quiet", action="store_true", help="Do not print every record")
+    parser.add_argument("--checkpoint", metavar="PATH",
+                        help="Save the controller state to this file periodically and restore it at startup")
+    parser.add_argument("--checkpoint-interval", type=float, default=5.0, help="Seconds between checkpoints")
+    parser.add_argument("--checkpoint-max-age", type=float, default=60.0,
+                        help="Resume active cycles only from checkpoints at most this many seconds old")
+    parser.add_argument("--arduino-intersection", default=DEFAULT_INTERSECTION,
+                        help="Intersection whose red times are sent to the Arduino")
+    return parse_args_with_config(parser, argv)
 
 
 def main():
@@ -212,50 +883,93 @@ def main():
     Main function to start the TCP server and manage the Arduino connection.
     
     The function performs the following steps:
-      - Sets up a TCP socket server on localhost (port 12345).
-      - Prompts the user for the COM port name to establish communication with Arduino.
-      - Listens for incoming connections, receives and decodes JSON data.
-      - Processes the incoming vehicle data and sends back the computed result.
+      - Sets up a TCP socket server (localhost, port 12345 by default).
+      - Opens the Arduino port given with --com-port in the background; the COM port
+        is only prompted for when it is not configured and a terminal is attached.
+      - With --protocol binary, talks to the Arduino with framed, acknowledged TIMERS frames.
+      - Listens for incoming connections and serves each one on its own thread.
+      - Processes the incoming vehicle data and sends back the computed result; each
+        intersection has its own controller state and mode (--controller, --intersection).
+      - Merges per-second counts streamed by the camera scripts in headless mode.
+      - With --bus, also answers same-host simulations through shared memory (state_bus.py).
+      - With --checkpoint, restores the controller state at startup and saves it periodically.
       - Handles cleanup of socket and Arduino connection on exit.
     """
-    global arduino_ser
-    host = 'localhost'
-    port = 12345
+    global arduino_connecting, arduino_disabled, serial_protocol, controller_mode, arduino_intersection, saturation_flow, verbose
+    args = parse_args()
+    serial_protocol = args.protocol
+    controller_mode = args.controller
+    saturation_flow = args.saturation_flow
+    verbose = not args.quiet
+    arduino_intersection = args.arduino_intersection
+    for item in args.intersection:
+        name, _, mode = item.partition("=")
+        if mode not in CONTROLLER_MODES:
+            sys.exit(f"Invalid --intersection {item!r}: expected ID=MODE with MODE in {', '.join(CONTROLLER_MODES)}")
+        intersection_modes[name] = mode
+
+    checkpoint_stop = threading.Event()
+    if args.checkpoint:
+        load_checkpoint(args.checkpoint, args.checkpoint_max_age)
+        threading.Thread(target=checkpoint_loop, args=(args.checkpoint, args.checkpoint_interval, checkpoint_stop),
+                         daemon=True).start()
+
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.bind((host, port))
+    if os.name != "nt":
+        # Allow an immediate restart while old connections are in TIME_WAIT
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind((args.host, args.port))
     s.listen(5)
-    print("Server started on port", port)
-    
-    # Prompt the user to enter the COM port name for Arduino communication (e.g., COM4)
-    com_port = input("Enter COM port name (e.g., COM4): ").strip()
-    baud_rate = 9600
-    try:
-        arduino_ser = serial.Serial(com_port, baud_rate, timeout=1)
-        time.sleep(2)  # Wait for Arduino to reset after opening the port
-        print("Successfully connected to Arduino on", com_port)
-    except Exception as e:
-        print("Unable to open Arduino port", com_port, ":", e)
-        # Continue running the server without sending commands to Arduino
+    print("Server started on port", args.port)
     
+    com_port = args.com_port
+    if com_port is None and not args.no_serial and sys.stdin is not None and sys.stdin.isatty():
+        # Prompt the user to enter the COM port name for Arduino communication (e.g., COM4)
+        com_port = input("Enter COM port name (e.g., COM4): ").strip()
+    if com_port and not args.no_serial:
+        arduino_connecting = True
+        threading.Thread(target=connect_arduino, args=(com_port, args.baud, args.ready_timeout),
+                         daemon=True).start()
+    else:
+        arduino_disabled = True
+        print("Running without Arduino.")
+
+    bus = None
+    bus_stop = threading.Event()
+    bus_thread = None
+    if args.bus:
+        import state_bus
+
+        bus = state_bus.StateBus(args.bus, args.bus_slots, create=True)
+        bus_thread = threading.Thread(target=state_bus.serve, args=(bus, handle_bus_sample, bus_stop), daemon=True)
+        bus_thread.start()
+        print(f"State bus {bus.name!r} with {bus.nslots} slots")
+
+    # Run the cleanup below (checkpoint, state bus, serial port) also when stopped
+    # by a service manager
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     try:
         while True:
             conn, addr = s.accept()
-            with conn:
-                data = conn.recv(4096)
-                if not data:
-                    continue
-                try:
-                    vehicle_data = json.loads(data.decode())
-                except Exception as e:
-                    print("Error decoding JSON:", e)
-                    continue
-                result = process_data(conn, vehicle_data)
-                response = json.dumps(result, ensure_ascii=False)
-                conn.sendall(response.encode())
+            # Responses are small and waited for: send them without delay
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
     except KeyboardInterrupt:
         print("Server stopped by user (Ctrl+C).")
     finally:
         s.close()
+        if args.checkpoint:
+            checkpoint_stop.set()
+            save_checkpoint(args.checkpoint)
+            print("Saved controller state to", args.checkpoint)
+        if bus is not None:
+            bus_stop.set()
+            bus_thread.join(timeout=1)
+            bus.close(unlink=True)
+        if arduino_link is not None:
+            arduino_link.close()
+            print("Serial link stats:", arduino_link.stats)
         if arduino_ser is not None:
             arduino_ser.close()
             print("Closed Arduino connection.")
@@ -0,0 +1,325 @@
+# headless_sim.py
+import argparse
+import math
+import random
+import time
+from collections import deque
+
+import control
+from bench_utils import fmt, latency_summary, percentile, save_json
+from predictive import WEIGHTS
+
+yellowTime = 3
+VEHICLE_TYPES = ('car', 'bus', 'truck', 'motorcycle')
+DIRECTIONS = ('east', 'south', 'west', 'north')
+APPROACH_DIRECTIONS = {"EW": ('east', 'west'), "NS": ('north', 'south')}
+
+# simulation.py spawns one vehicle every 2 s in one of the four directions
+DEFAULT_ARRIVAL_RATE = 1 / (2.0 * 4)
+
+
+class SimIntersection:
+    """
+    Discrete-time (1 s) queue model of one intersection, driven by a controller.
+
+    The signal timers follow simulation.py's lightCycle() and the samples have the
+    same fields as its update_signal_timings(), so the controller sees the same
+    protocol as with the pygame simulation. Vehicles queue per direction and leave
+    at the saturation flow while their direction is green.
+
+    Parameters:
+        controller (control.Intersection): Controller state receiving the samples.
+        rates (dict): Mean arrival rate per direction (vehicles per second).
+        rng (random.Random): Random source of the arrivals.
+        multiplier (int): Real vehicles represented by each simulated vehicle (as in simulation.py).
+        saturation (float): Vehicles per second leaving a direction while it is green.
+        variation (float): Relative amplitude of the sinusoidal demand profile.
+        period (float): Period of the demand profile (seconds).
+    """
+
+    def __init__(self, controller, rates, rng, multiplier=3, saturation=0.5, variation=0.5, period=1800):
+        self.controller = controller
+        self.rates = rates
+        self.rng = rng
+        self.multiplier = multiplier
+        self.saturation = saturation
+        self.variation = variation
+        self.period = period
+        self.queues = {d: deque() for d in DIRECTIONS}  # (arrival second, vehicle type)
+        self.credit = {d: 0.0 for d in DIRECTIONS}
+
+        # Same initial state as simulation.py
+        self.EWgreen, self.EWyellow, self.EWred = 15, 0, 0
+        self.NSgreen, self.NSyellow, self.NSred = 0, 0, 18
+        self.phase = None
+
+        self.delays = []
+        self.max_queue = 0
+        self.greens = []
+        self.decision_ms = []
+        self.process_ms = []
+
+    def arrivals(self, t):
+        demand = 1 + self.variation * math.sin(2 * math.pi * t / self.period)
+        for d in DIRECTIONS:
+            for _ in range(poisson(self.rng, self.rates[d] * demand)):
+                self.queues[d].append((t, self.rng.choice(VEHICLE_TYPES)))
+
+    def sample(self):
+        """Builds the sample simulation.py would send now."""
+        data = {}
+        for d in DIRECTIONS:
+            counts = dict.fromkeys(VEHICLE_TYPES, 0)
+            for _, vtype in self.queues[d]:
+                counts[vtype] += 1
+            data[d] = {k: self.multiplier * v for k, v in counts.items()}
+        data["phase_start"] = 0
+        data["red_time_eastwest"] = self.EWred
+        data["red_time_northsouth"] = self.NSred
+        return data
+
+    def update_signal_timings(self):
+        start = time.perf_counter()
+        timings = self.controller.process(self.sample())
+        elapsed = (time.perf_counter() - start) * 1000
+        self.process_ms.append(elapsed)
+        if self.apply_timings(timings):
+            self.decision_ms.append(elapsed)
+
+    def apply_timings(self, timings):
+        """Applies a controller response; returns True if it carried new green times."""
+        new_EWgreen = timings.get("eastwest_green")
+        new_NSgreen = timings.get("northsouth_green")
+        # Only update if the current signals are in a waiting state (as simulation.py does)
+        if new_EWgreen is not None and new_EWgreen >= 15 and self.EWgreen == 0:
+            self.EWgreen = new_EWgreen
+            self.NSred = timings.get("northsouth_red", self.EWgreen + yellowTime)
+            self.greens.append(new_EWgreen)
+        if new_NSgreen is not None and new_NSgreen >= 15 and self.NSgreen == 0:
+            self.NSgreen = new_NSgreen
+            self.EWred = timings.get("eastwest_red", self.NSgreen + yellowTime)
+            self.greens.append(new_NSgreen)
+        return new_EWgreen is not None or new_NSgreen is not None
+
+    def light_cycle(self, t):
+        """Advances the signals by one second, discharging the green directions."""
+        if self.phase is None:
+            if self.NSgreen > 0 and self.EWred > 0:
+                self.phase = "NSgreen"
+            elif self.EWgreen > 0 and self.NSred > 0:
+                self.phase = "EWgreen"
+            else:
+                return
+
+        if self.phase == "NSgreen":
+            self.depart(APPROACH_DIRECTIONS["NS"], t)
+            self.NSgreen -= 1
+            self.EWred -= 1
+            if self.NSgreen <= 0:
+                self.NSyellow = yellowTime
+                self.EWred = yellowTime
+                self.phase = "NSyellow"
+        elif self.phase == "NSyellow":
+            self.NSyellow -= 1
+            self.EWred -= 1
+            if self.NSyellow <= 0:
+                self.phase = None
+        elif self.phase == "EWgreen":
+            self.depart(APPROACH_DIRECTIONS["EW"], t)
+            self.EWgreen -= 1
+            self.NSred -= 1
+            if self.EWgreen <= 0:
+                self.EWyellow = yellowTime
+                self.NSred = yellowTime
+                self.phase = "EWyellow"
+        elif self.phase == "EWyellow":
+            self.EWyellow -= 1
+            self.NSred -= 1
+            if self.EWyellow <= 0:
+                self.phase = None
+
+    def depart(self, directions, t):
+        for d in directions:
+            queue = self.queues[d]
+            self.credit[d] = min(self.credit[d] + self.saturation, max(1.0, self.saturation))
+            while queue and self.credit[d] >= 1:
+                arrived, _ = queue.popleft()
+                self.delays.append(t - arrived)
+                self.credit[d] -= 1
+            if not queue:
+                self.credit[d] = 0.0
+
+    def step(self, t):
+        self.arrivals(t)
+        self.update_signal_timings()
+        self.advance(t)
+
+    def advance(self, t):
+        self.light_cycle(t)
+        self.max_queue = max(self.max_queue, sum(len(q) for q in self.queues.values()))
+
+
+class TimedIntersection(control.Intersection):
+    """control.Intersection that times its green time choices (green_times()) on their own."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.choice_ms = []
+
+    def green_times(self, served):
+        start = time.perf_counter()
+        greens = super().green_times(served)
+        self.choice_ms.append((time.perf_counter() - start) * 1000)
+        return greens
+
+
+def poisson(rng, lam):
+    """Draws a Poisson-distributed count (Knuth's method; fine for small means)."""
+    limit = math.exp(-lam)
+    k = 0
+    p = rng.random()
+    while p > limit:
+        k += 1
+        p *= rng.random()
+    return k
+
+
+def intersection_rates(index, base_rate, imbalance, seed):
+    """Arrival rates per direction; each intersection gets its own EW/NS split."""
+    rng = random.Random(seed * 1000003 + index)
+    ew_share = rng.uniform(1 / imbalance, imbalance) if imbalance > 1 else 1.0
+    ew = base_rate * 2 * ew_share / (1 + ew_share)
+    ns = base_rate * 2 / (1 + ew_share)
+    return {'east': ew, 'west': ew, 'north': ns, 'south': ns}
+
+
+def make_sims(args, controllers):
+    sims = []
+    for i, controller in enumerate(controllers):
+        rates = intersection_rates(i, args.arrival_rate, args.imbalance, args.seed)
+        # Same seed for every mode: all controllers see the same arrivals
+        rng = random.Random(args.seed * 7919 + i)
+        sims.append(SimIntersection(controller, rates, rng, args.multiplier, args.saturation,
+                                    args.variation, args.period))
+    return sims
+
+
+def run(mode, args):
+    """Simulates all intersections with one controller mode and returns the results."""
+    sims = make_sims(args, [TimedIntersection(f"sim{i}", mode, verbose=False)
+                            for i in range(args.intersections)])
+    start = time.perf_counter()
+    for t in range(args.duration):
+        for sim in sims:
+            sim.step(t)
+    return summarize(mode, sims, time.perf_counter() - start)
+
+
+def run_bus(args):
+    """
+    Simulates all intersections against a running control.py through its state bus.
+
+    Every simulated second, the samples of all intersections are published at once
+    and the controller's responses are collected before the signals advance.
+    """
+    from state_bus import StateBus
+
+    bus = StateBus(args.bus)
+    if args.intersections > bus.nslots:
+        raise SystemExit(f"The bus has {bus.nslots} slots; start control.py with --bus-slots {args.intersections}")
+    try:
+        for i in range(args.intersections):
+            bus.set_name(i, f"sim{i}")
+        sims = make_sims(args, [None] * args.intersections)
+        round_trip_ms = []
+        start = time.perf_counter()
+        for t in range(args.duration):
+            sent = time.perf_counter()
+            seqs = []
+            for i, sim in enumerate(sims):
+                sim.arrivals(t)
+                seqs.append(bus.publish(i, sim.sample()))
+            for i, sim in enumerate(sims):
+                sim.apply_timings(bus.wait_response(i, seqs[i], timeout=5.0))
+            round_trip_ms.append((time.perf_counter() - sent) * 1000)
+            for sim in sims:
+                sim.advance(t)
+        result = summarize("bus:" + args.bus, sims, time.perf_counter() - start)
+    finally:
+        bus.close()
+    result["round_trip_ms"] = latency_summary(round_trip_ms)
+    result["samples_per_s"] = args.intersections * args.duration / result["wall_s"]
+    return result
+
+
+def summarize(mode, sims, wall):
+    delays = [d for sim in sims for d in sim.delays]
+    waiting = sum(len(q) for sim in sims for q in sim.queues.values())
+    greens = [g for sim in sims for g in sim.greens]
+    return {
+        "mode": mode,
+        "vehicles_served": len(delays),
+        "vehicles_waiting": waiting,
+        "mean_delay_s": sum(delays) / len(delays) if delays else None,
+        "p95_delay_s": percentile(delays, 95),
+        "max_queue": max(sim.max_queue for sim in sims),
+        "mean_green_s": sum(greens) / len(greens) if greens else None,
+        "decisions": len(greens),
+        "decision_ms": latency_summary([ms for sim in sims for ms in sim.decision_ms]),
+        "process_ms": latency_summary([ms for sim in sims for ms in sim.process_ms]),
+        "choice_ms": latency_summary([ms for sim in sims for ms in getattr(sim.controller, "choice_ms", ())]),
+        "wall_s": wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare controller modes on a headless queue simulation")
+    parser.add_argument("--controllers", nargs="+", choices=control.CONTROLLER_MODES,
+                        default=list(control.CONTROLLER_MODES), help="Controller modes to compare")
+    parser.add_argument("--intersections", type=int, default=10, help="Simulated intersections")
+    parser.add_argument("--duration", type=int, default=3600, help="Simulated seconds")
+    parser.add_argument("--arrival-rate", type=float, default=DEFAULT_ARRIVAL_RATE,
+                        help="Mean vehicles per second per direction")
+    parser.add_argument("--imbalance", type=float, default=2.0,
+                        help="Maximum ratio between the EW and NS demand of an intersection")
+    parser.add_argument("--variation", type=float, default=0.5, help="Relative amplitude of the demand profile")
+    parser.add_argument("--period", type=float, default=1800, help="Period of the demand profile (seconds)")
+    parser.add_argument("--saturation", type=float, default=0.5,
+                        help="Vehicles per second leaving each direction while green")
+    parser.add_argument("--multiplier", type=int, default=3,
+                        help="Real vehicles represented by each simulated vehicle")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--bus", metavar="NAME",
+                        help="Run against a control.py started with --bus NAME instead of in-process controllers")
+    parser.add_argument("--output", default="headless_sim.json", help="JSON file for the results")
+    args = parser.parse_args()
+
+    # Saturation flow of an approach in the units of the samples: two directions,
+    # scaled by the multiplier, weighted by the mean vehicle weight
+    mean_weight = sum(WEIGHTS[k] for k in VEHICLE_TYPES) / len(VEHICLE_TYPES)
+    control.saturation_flow = 2 * args.saturation * args.multiplier * mean_weight
+
+    results = []
+    if args.bus:
+        r = run_bus(args)
+        results.append(r)
+        rt = r["round_trip_ms"]
+        print(f"{r['mode']}: {r['samples_per_s']:.0f} samples/s, round trip of all intersections "
+              f"p50={rt['p50']:.3f}ms p99={rt['p99']:.3f}ms")
+    else:
+        for mode in args.controllers:
+            results.append(run(mode, args))
+    for r in results:
+        d, c = r["decision_ms"], r["choice_ms"]
+        decision = f" decision p99={fmt(d['p99'], '.3f')}ms max={fmt(d['max'], '.3f')}ms" if d["p99"] is not None else ""
+        if c["p99"] is not None:
+            decision += f" (choice p99={fmt(c['p99'], '.3f')}ms max={fmt(c['max'], '.3f')}ms)"
+        print(f"{r['mode']:<11} served={r['vehicles_served']:<7} waiting={r['vehicles_waiting']:<5} "
+              f"mean delay={fmt(r['mean_delay_s'])}s p95={fmt(r['p95_delay_s'], '.0f')}s max queue={r['max_queue']:<4} "
+              f"mean green={fmt(r['mean_green_s'])}s" + decision)
+
+    save_json(args.output, {"args": vars(args), "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# history.py
+import threading
+import time
+
+import numpy as np
+
+# Weight factors for different vehicle types (same as control.py)
+WEIGHTS = {'car': 1, 'bus': 2, 'truck': 3, 'motorcycle': 0.5}
+
+# Approach order of the two-element fields: (East-West, North-South)
+SAMPLE_DTYPE = np.dtype([("t", "<f8"), ("flow", "<f4", (2,)), ("red", "<i2", (2,))])
+CYCLE_DTYPE = np.dtype([("t", "<f8"), ("duration", "<f4"), ("served", "u1"), ("flow", "<f4", (2,)),
+                        ("ma", "<f4", (2,)), ("green", "<i2")])
+BUCKET_DTYPE = np.dtype([("t", "<f8"), ("n", "<u4"), ("flow_sum", "<f8", (2,)), ("flow_max", "<f4", (2,))])
+
+SERVED = ("EW", "NS")
+
+
+class Ring:
+    """Fixed-capacity ring buffer of numpy records; the oldest record is overwritten."""
+
+    def __init__(self, dtype, capacity):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.head = 0   # Next write position
+        self.size = 0
+
+    def append(self, record):
+        self.data[self.head] = record
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def view(self):
+        """Returns a chronological copy of the stored records."""
+        if self.size < self.capacity:
+            return self.data[:self.size].copy()
+        return np.concatenate((self.data[self.head:], self.data[:self.head]))
+
+    def oldest(self):
+        if self.size == 0:
+            return None
+        return self.data[(self.head - self.size) % self.capacity]["t"]
+
+    def covers(self, start):
+        """True if no record at or after `start` has been overwritten yet."""
+        return self.size < self.capacity or start is None or self.oldest() <= start
+
+
+class Tier:
+    """
+    Downsampled sample history: one bucket (count, sum and max of the flows) per
+    `width` seconds. The bucket being filled is kept in Python numbers until its
+    period ends, which keeps adding a sample cheap.
+    """
+
+    def __init__(self, width, capacity):
+        self.width = width
+        self.ring = Ring(BUCKET_DTYPE, capacity)
+        self.key = None
+        self.n = 0
+        self.flow_sum = [0.0, 0.0]
+        self.flow_max = [0.0, 0.0]
+
+    def current(self):
+        return np.array((self.key * self.width, self.n, self.flow_sum, self.flow_max), dtype=BUCKET_DTYPE)
+
+    def add(self, t, n, flow_sum, flow_max):
+        """
+        Adds samples to the bucket of time `t`.
+
+        Returns:
+            The bucket that was closed by this call, or None.
+        """
+        key = int(t // self.width)
+        closed = None
+        if key != self.key:
+            if self.key is not None:
+                closed = self.current()
+                self.ring.append(closed)
+            self.key = key
+            self.n = 0
+            self.flow_sum = [0.0, 0.0]
+            self.flow_max = [0.0, 0.0]
+        self.n += n
+        for i in (0, 1):
+            self.flow_sum[i] += flow_sum[i]
+            self.flow_max[i] = max(self.flow_max[i], flow_max[i])
+        return closed
+
+    def view(self):
+        """Returns the closed buckets and the current one, oldest first."""
+        if self.key is None:
+            return self.ring.view()
+        return np.concatenate((self.ring.view(), self.current().reshape(1)))
+
+    def covers(self, start):
+        return self.ring.covers(start)
+
+
+class History:
+    """
+    Bounded history of one intersection in numpy ring buffers.
+
+    Keeps the last `seconds` per-second samples and `cycles` cycle results, plus
+    per-minute and per-hour aggregates of the samples for older data. Recording a
+    sample or a cycle is a few array writes (the mean flows of a cycle are summed up
+    as its samples arrive); queries copy the rings under a short lock and aggregate
+    the copy with numpy, outside of the controller's state lock.
+
+    Parameters:
+        seconds (int): Per-second samples kept (default: one hour).
+        cycles (int): Cycle results kept.
+        minutes (int): Per-minute buckets kept (default: one day).
+        hours (int): Per-hour buckets kept (default: 30 days).
+    """
+
+    def __init__(self, seconds=3600, cycles=1000, minutes=1440, hours=720):
+        self.samples = Ring(SAMPLE_DTYPE, seconds)
+        self.cycles = Ring(CYCLE_DTYPE, cycles)
+        self.tiers = (("1min", Tier(60, minutes)), ("1h", Tier(3600, hours)))
+        self.lock = threading.Lock()
+        # Flow sums of the samples since the current cycle started (see begin_cycle())
+        self.cycle_flow = [0.0, 0.0]
+        self.cycle_samples = 0
+
+    def add_sample(self, data, t=None):
+        """Records the weighted flows and red times of one sample."""
+        t = time.time() if t is None else t
+        flow = [sum(WEIGHTS[k] * data.get(d, {}).get(k, 0) for d in directions for k in WEIGHTS)
+                for directions in (("east", "west"), ("north", "south"))]
+        red = (data.get("red_time_eastwest") or 0, data.get("red_time_northsouth") or 0)
+        with self.lock:
+            self.samples.append((t, flow, red))
+            self.cycle_flow[0] += flow[0]
+            self.cycle_flow[1] += flow[1]
+            self.cycle_samples += 1
+            # Each closed bucket cascades into the next, coarser tier
+            bucket = (t, 1, flow, flow)
+            for _, tier in self.tiers:
+                closed = tier.add(*bucket)
+                if closed is None:
+                    break
+                bucket = (float(closed["t"]), int(closed["n"]), closed["flow_sum"].tolist(),
+                          closed["flow_max"].tolist())
+        return flow
+
+    def begin_cycle(self):
+        """Starts summing up the flows of a new cycle (the samples added from now on)."""
+        with self.lock:
+            self.cycle_flow = [0.0, 0.0]
+            self.cycle_samples = 0
+
+    def add_cycle(self, start, served, ma, green, t=None):
+        """
+        Records the result of a cycle, with the mean flows of the samples since begin_cycle().
+
+        Parameters:
+            start (float): Time the cycle started.
+            served (str): Direction whose red phase ended ("EW" or "NS").
+            ma (tuple): Flow estimates (East-West, North-South) after the cycle: the moving
+                averages in "ema" mode, the predicted queues in "predictive" mode.
+            green (int): Green time computed for the served direction.
+        """
+        t = time.time() if t is None else t
+        with self.lock:
+            n = self.cycle_samples
+            flow = [s / n for s in self.cycle_flow] if n else (0.0, 0.0)
+            self.cycles.append((t, t - start, SERVED.index(served), flow, ma, green))
+            self.cycle_flow = [0.0, 0.0]
+            self.cycle_samples = 0
+
+    def query(self, kind="samples", start=None, end=None, bins=None):
+        """
+        Aggregates the history over a time range.
+
+        Samples come from the finest resolution that still holds all data since
+        `start` (per-second, then per-minute, then per-hour). The per-hour tier
+        receives the per-minute buckets when they close, so it lags by up to a minute.
+
+        Parameters:
+            kind (str): "samples" (flows) or "cycles" (cycle results).
+            start (float): Range start (UNIX time; default: oldest data).
+            end (float): Range end (UNIX time; default: now).
+            bins (int): Also return this many equal-width sub-ranges of mean flows / greens.
+
+        Returns:
+            dict: JSON-serializable aggregates.
+        """
+        end = time.time() if end is None else end
+        if kind == "samples":
+            return self._query_samples(start, end, bins)
+        if kind == "cycles":
+            return self._query_cycles(start, end, bins)
+        raise ValueError(f"Unknown history kind {kind!r}; choose samples or cycles")
+
+    def _query_samples(self, start, end, bins):
+        with self.lock:
+            tier = None
+            resolution = "1s"
+            if not self.samples.covers(start):
+                # The coarsest tier is used even if it lost the beginning of the range
+                resolution, tier = self.tiers[-1]
+                for name, candidate in self.tiers:
+                    if candidate.covers(start):
+                        resolution, tier = name, candidate
+                        break
+                rows = tier.view()
+            else:
+                rows = self.samples.view()
+
+        if tier is None:
+            t, n = rows["t"], np.ones(len(rows))
+            flow_sum, flow_max = rows["flow"].astype(float), rows["flow"]
+            mask = t <= end
+            if start is not None:
+                mask &= t >= start
+        else:
+            # Buckets are stamped with their start time; keep those overlapping the range
+            t, n, flow_sum, flow_max = rows["t"], rows["n"].astype(float), rows["flow_sum"], rows["flow_max"]
+            mask = (t <= end) & (t + tier.width > start)
+        t, n, flow_sum, flow_max = t[mask], n[mask], flow_sum[mask], flow_max[mask]
+
+        total = n.sum()
+        result = {"kind": "samples", "resolution": resolution, "samples": int(total),
+                  "start": start if start is not None else (float(t[0]) if len(t) else None), "end": end}
+        for i, approach in enumerate(("eastwest", "northsouth")):
+            result[f"flow_{approach}"] = {
+                "mean": float(flow_sum[:, i].sum() / total) if total else None,
+                "max": float(flow_max[:, i].max()) if len(t) else None,
+            }
+        if bins and len(t):
+            result["bins"] = _binned_means(t, result["start"], end, bins, n, flow_sum)
+        return result
+
+    def _query_cycles(self, start, end, bins):
+        with self.lock:
+            rows = self.cycles.view()
+        mask = rows["t"] <= end
+        if start is not None:
+            mask &= rows["t"] >= start
+        rows = rows[mask]
+        result = {"kind": "cycles", "cycles": len(rows),
+                  "start": start if start is not None else (float(rows["t"][0]) if len(rows) else None), "end": end}
+        for i, served in enumerate(SERVED):
+            greens = rows["green"][rows["served"] == i]
+            result[f"green_{served}"] = {"mean": float(greens.mean()) if len(greens) else None,
+                                         "min": int(greens.min()) if len(greens) else None,
+                                         "max": int(greens.max()) if len(greens) else None}
+        result["mean_flow"] = rows["flow"].mean(axis=0).tolist() if len(rows) else None
+        result["last_ma"] = rows["ma"][-1].tolist() if len(rows) else None
+        if bins and len(rows):
+            greens = np.column_stack((np.where(rows["served"] == 0, rows["green"], 0),
+                                      np.where(rows["served"] == 1, rows["green"], 0))).astype(float)
+            counts = np.column_stack((rows["served"] == 0, rows["served"] == 1)).astype(float)
+            result["bins"] = _binned_means(rows["t"], result["start"], end, bins, counts, greens)
+        return result
+
+
+def _binned_means(t, start, end, bins, weights, values):
+    """
+    Means of `values` (rows of two columns) in `bins` equal-width time ranges.
+
+    `weights` is the number of samples each row stands for (one column, or one per value column).
+    Returns a list of {"start", "mean": [ew, ns]} entries, with None for empty bins.
+    """
+    edges = np.linspace(start, end, bins + 1)
+    index = np.clip(np.searchsorted(edges, t, side="right") - 1, 0, bins - 1)
+    weights = weights.reshape(len(t), -1) * np.ones((1, 2))
+    sums = np.stack([np.bincount(index, values[:, i], bins) for i in range(2)], axis=1)
+    counts = np.stack([np.bincount(index, weights[:, i], bins) for i in range(2)], axis=1)
+    return [{"start": float(edges[b]),
+             "mean": [float(s / c) if c else None for s, c in zip(sums[b], counts[b])]}
+            for b in range(bins)]
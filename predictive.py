@@ -0,0 +1,163 @@
+# predictive.py
+import functools
+
+import numpy as np
+
+# Weight factors for different vehicle types (same as control.py)
+WEIGHTS = {'car': 1, 'bus': 2, 'truck': 3, 'motorcycle': 0.5}
+
+# Approaches and the directions they contain
+APPROACHES = {"EW": ("east", "west"), "NS": ("north", "south")}
+
+# Grid of the precomputed timing table
+QUEUE_STEP = 5.0      # Weighted vehicles per queue bin
+QUEUE_BINS = 41       # Queues from 0 to 200
+RATE_STEP = 0.25      # Weighted vehicles per second per arrival-rate bin
+RATE_BINS = 17        # Arrival rates from 0 to 4 per second
+
+
+def horizon_delay(q, rate, mu, green):
+    """
+    Vehicle-seconds of delay on an approach over a signal plan (fluid queue model).
+
+    Each second, the queue grows by the arrival rate and, while the approach is
+    green, shrinks by the saturation flow `mu`. Works element-wise on numpy arrays.
+
+    Parameters:
+        q (numpy.ndarray): Initial queues.
+        rate (numpy.ndarray): Arrival rates (same shape as q).
+        mu (float): Saturation flow.
+        green (sequence): 1 for each second the approach is green, 0 when red.
+
+    Returns:
+        numpy.ndarray: Total delay over the plan.
+    """
+    q = q.astype(float)
+    delay = np.zeros_like(q)
+    for is_green in green:
+        q = np.maximum(0.0, q + rate - mu * is_green)
+        delay += q
+    return delay
+
+
+@functools.lru_cache(maxsize=None)
+def build_table(t_min, t_max, yellow, mu):
+    """
+    Precomputes the best green time for every queue/arrival-rate state.
+
+    For each green time g in [t_min, t_max], the delay of both approaches is
+    predicted over a fixed horizon of t_max + yellow + t_min + yellow seconds:
+    the served approach (about to turn green) is green for g, then the other one
+    is green for t_min after the yellow, then the served approach again until the
+    horizon ends. The table holds the g with the least total delay; a short g
+    hands over to the other approach sooner, a long one clears the served queue.
+    Tables are cached per set of parameters.
+
+    Returns:
+        numpy.ndarray: uint8 table indexed by [q_served, rate_served, q_other, rate_other].
+    """
+    q = np.arange(QUEUE_BINS) * QUEUE_STEP
+    r = np.arange(RATE_BINS) * RATE_STEP
+    q, r = (a.ravel() for a in np.meshgrid(q, r, indexing="ij"))
+    greens = np.arange(t_min, t_max + 1)
+    horizon = t_max + yellow + t_min + yellow
+
+    # Delay of each (queue, rate) state, as the served and as the other approach, per green time
+    delay_s = np.empty((len(q), len(greens)))
+    delay_o = np.empty((len(q), len(greens)))
+    for j, g in enumerate(greens):
+        other_start = g + yellow
+        other_end = other_start + t_min
+        served_green = [int(t < g or t >= other_end + yellow) for t in range(horizon)]
+        other_green = [int(other_start <= t < other_end) for t in range(horizon)]
+        delay_s[:, j] = horizon_delay(q, r, mu, served_green)
+        delay_o[:, j] = horizon_delay(q, r, mu, other_green)
+
+    # Total delay for every (served state, other state, green time),
+    # a block of served states at a time to bound the memory use
+    best = np.empty((len(q), len(q)), dtype=np.uint8)
+    for i in range(0, len(q), RATE_BINS):
+        cost = delay_s[i:i + RATE_BINS, None, :] + delay_o[None, :, :]
+        best[i:i + RATE_BINS] = greens[np.argmin(cost, axis=2)]
+    return best.reshape(QUEUE_BINS, RATE_BINS, QUEUE_BINS, RATE_BINS)
+
+
+class PredictiveController:
+    """
+    Chooses green times by minimizing the predicted delay, using a precomputed table.
+
+    Every per-second sample updates, for each approach (EW and NS):
+      - the queue: weighted vehicle count on the approach in the latest sample;
+      - the arrival rate: growth of the count per second while the approach is red
+        (when no vehicle can leave), as exponentially decayed sums of the growth and
+        of the red seconds, so that single heavy vehicles do not make it jump. Samples
+        repeating the previous red times (several updates within one second) only
+        refresh the queue.
+    A decision is a table lookup on these estimates, so it takes microseconds.
+
+    Parameters:
+        t_min (int): Minimum green time (seconds).
+        t_max (int): Maximum green time (seconds).
+        yellow (int): Yellow time (seconds).
+        saturation_flow (float): Weighted vehicles per second an approach discharges when green.
+        decay (float): Per red second decay of the arrival sums (0.98: ~50 s memory).
+    """
+
+    def __init__(self, t_min=15, t_max=45, yellow=3, saturation_flow=2.0, decay=0.98):
+        self.t_min = t_min
+        self.t_max = t_max
+        self.decay = decay
+        self.table = build_table(t_min, t_max, yellow, saturation_flow)
+        self.queue = {"EW": 0.0, "NS": 0.0}
+        self.rate = {"EW": 0.0, "NS": 0.0}
+        self.arrivals = {"EW": 0.0, "NS": 0.0}      # Decayed count growth while red
+        self.red_seconds = {"EW": 0.0, "NS": 0.0}   # Decayed red seconds
+        self.last_count = {"EW": None, "NS": None}
+        self.last_red = None
+
+    def observe(self, data):
+        """Updates the queue and arrival-rate estimates from one sample."""
+        red = {"EW": data.get("red_time_eastwest") or 0, "NS": data.get("red_time_northsouth") or 0}
+        repeat = red == self.last_red
+        self.last_red = red
+        for approach, directions in APPROACHES.items():
+            count = sum(WEIGHTS[k] * data.get(d, {}).get(k, 0) for d in directions for k in WEIGHTS)
+            if repeat:
+                self.queue[approach] = count
+                continue
+            last = self.last_count[approach]
+            if last is not None and red[approach] > 0:
+                self.arrivals[approach] = self.decay * self.arrivals[approach] + max(0.0, count - last)
+                self.red_seconds[approach] = self.decay * self.red_seconds[approach] + 1
+                self.rate[approach] = self.arrivals[approach] / self.red_seconds[approach]
+            self.queue[approach] = count
+            self.last_count[approach] = count
+
+    def green_time(self, served):
+        """
+        Returns the green time for the approach about to turn green ("EW" or "NS").
+        """
+        other = "NS" if served == "EW" else "EW"
+        return int(self.table[self._queue_bin(self.queue[served]), self._rate_bin(self.rate[served]),
+                              self._queue_bin(self.queue[other]), self._rate_bin(self.rate[other])])
+
+    @staticmethod
+    def _queue_bin(value):
+        return min(QUEUE_BINS - 1, max(0, int(round(value / QUEUE_STEP))))
+
+    @staticmethod
+    def _rate_bin(value):
+        return min(RATE_BINS - 1, max(0, int(round(value / RATE_STEP))))
+
+    def get_state(self):
+        """Returns the estimates as a JSON-serializable dict."""
+        return {"queue": dict(self.queue), "rate": dict(self.rate), "arrivals": dict(self.arrivals),
+                "red_seconds": dict(self.red_seconds), "last_count": dict(self.last_count)}
+
+    def set_state(self, state):
+        """Restores estimates saved by get_state()."""
+        self.queue.update(state.get("queue", {}))
+        self.rate.update(state.get("rate", {}))
+        self.arrivals.update(state.get("arrivals", {}))
+        self.red_seconds.update(state.get("red_seconds", {}))
+        self.last_count.update(state.get("last_count", {}))
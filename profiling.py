@@ -0,0 +1,231 @@
+# profiling.py
+import atexit
+import functools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import defaultdict
+
+# Opt-in profiling, configured by environment variables:
+#   TRAFFIC_PROFILE          Empty/unset: disabled (no overhead). Otherwise a comma-separated
+#                            list of: "timers" (implied), "sample" (start a sampling window at
+#                            startup), "tracemalloc" (trace allocations from startup).
+#   TRAFFIC_PROFILE_DIR      Output directory (default: profiles).
+#   TRAFFIC_PROFILE_SECONDS  Length of a sampling window (default: 10).
+# While enabled, SIGUSR1 starts a sampling window (stack samples of all threads and
+# cProfile of the timed sections) and SIGUSR2 writes a tracemalloc snapshot.
+OPTIONS = {o.strip() for o in os.environ.get("TRAFFIC_PROFILE", "").split(",") if o.strip() not in ("", "0")}
+ENABLED = bool(OPTIONS)
+PROFILE_DIR = os.environ.get("TRAFFIC_PROFILE_DIR", "profiles")
+WINDOW_SECONDS = float(os.environ.get("TRAFFIC_PROFILE_SECONDS", "10"))
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples during a window
+
+_lock = threading.Lock()
+_local = threading.local()
+# Collapsed stack ("thread;outer;inner") -> [calls, self time ns, total time ns, max time ns]
+_sections = defaultdict(lambda: [0, 0, 0, 0])
+_window = None           # The active sampling window, if any
+_windows_done = 0
+_snapshot = None         # Previous tracemalloc snapshot, to report the growth
+
+
+def timed(name):
+    """
+    Decorator timing a hot section under `name`.
+
+    When profiling is disabled, the function is returned unchanged.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+        return _timed(name, func)
+    return decorator
+
+
+def _timed(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = [threading.current_thread().name]
+            _local.children = [0]
+        stack.append(name)
+        _local.children.append(0)
+        # Only the outermost section of a thread runs under cProfile (it cannot nest).
+        # Read the window once: the sampler thread may reset it to None meanwhile.
+        window = _window
+        profiler = window.profiler() if window is not None and len(stack) == 2 else None
+        start = time.perf_counter_ns()
+        try:
+            if profiler is not None:
+                return profiler.runcall(func, *args, **kwargs)
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            children = _local.children.pop()
+            _local.children[-1] += elapsed
+            key = ";".join(stack)
+            stack.pop()
+            with _lock:
+                entry = _sections[key]
+                entry[0] += 1
+                entry[1] += elapsed - children
+                entry[2] += elapsed
+                entry[3] = max(entry[3], elapsed)
+    return wrapper
+
+
+def _path(suffix):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    prog = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+    return os.path.join(PROFILE_DIR, f"{prog}-{os.getpid()}-{suffix}")
+
+
+def dump_sections():
+    """
+    Writes the section timers:
+      - *-sections.collapsed: one "thread;section;... self_microseconds" line per
+        stack, for flamegraph.pl, speedscope or inferno;
+      - *-sections.json: calls, total, mean and max time per stack.
+    """
+    with _lock:
+        sections = {k: list(v) for k, v in _sections.items()}
+    if not sections:
+        return
+    with open(_path("sections.collapsed"), "w") as f:
+        for key, (_, self_ns, _, _) in sorted(sections.items()):
+            f.write(f"{key} {max(1, self_ns // 1000)}\n")
+    summary = {key: {"calls": calls, "total_ms": total / 1e6, "mean_us": total / calls / 1e3, "max_ms": peak / 1e6}
+               for key, (calls, _, total, peak) in sections.items()}
+    with open(_path("sections.json"), "w") as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+
+
+class _Window:
+    """
+    A sampling window: stack samples of all threads every SAMPLE_INTERVAL seconds,
+    and one cProfile profiler per thread for the timed sections.
+    """
+
+    def __init__(self, seconds, index):
+        import cProfile
+
+        self.cprofile = cProfile
+        self.index = index
+        self.deadline = time.monotonic() + seconds
+        self.stacks = defaultdict(int)
+        self.profilers = {}
+        self.thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def profiler(self):
+        """Returns the calling thread's profiler, or None if it cannot profile."""
+        ident = threading.get_ident()
+        profiler = self.profilers.get(ident)
+        if profiler is None:
+            if sys.version_info >= (3, 12) and self.profilers:
+                return None  # cProfile is process-wide since 3.12: only the first thread is profiled
+            profiler = self.profilers[ident] = self.cprofile.Profile()
+        return profiler
+
+    def _run(self):
+        global _window
+        names = {}
+        while time.monotonic() < self.deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == threading.get_ident():
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            time.sleep(SAMPLE_INTERVAL)
+        _window = None
+        self.dump()
+
+    def dump(self):
+        """Writes *-N-stacks.collapsed (sample counts per stack) and *-N.prof (cProfile)."""
+        with open(_path(f"{self.index}-stacks.collapsed"), "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        stats = None
+        for profiler in list(self.profilers.values()):
+            try:
+                if stats is None:
+                    import pstats
+
+                    stats = pstats.Stats(profiler)
+                else:
+                    stats.add(profiler)
+            except TypeError:
+                continue  # The profiler never collected anything
+        if stats is not None:
+            stats.dump_stats(_path(f"{self.index}.prof"))
+        dump_sections()
+        print(f"Profiling window {self.index} written to {PROFILE_DIR}")
+
+
+def start_window(seconds=WINDOW_SECONDS):
+    """Starts a sampling window unless one is running."""
+    global _window, _windows_done
+    if not ENABLED or _window is not None:
+        return
+    _windows_done += 1
+    _window = _Window(seconds, _windows_done)
+    _window.thread.start()
+
+
+def tracemalloc_snapshot():
+    """
+    Starts tracemalloc on the first call; afterwards writes a snapshot
+    (*-<time>.tracemalloc, readable with tracemalloc.Snapshot.load) and the top
+    allocation sites and their growth since the previous snapshot (*-<time>-tracemalloc.txt).
+    """
+    global _snapshot
+    import tracemalloc
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(25)
+        print("tracemalloc started; send the signal again for a snapshot")
+        return
+    snapshot = tracemalloc.take_snapshot()
+    index = time.strftime("%Y%m%d-%H%M%S")
+    snapshot.dump(_path(f"{index}.tracemalloc"))
+    with open(_path(f"{index}-tracemalloc.txt"), "w") as f:
+        current, peak = tracemalloc.get_traced_memory()
+        f.write(f"traced: {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB\n\nTop allocation sites:\n")
+        for stat in snapshot.statistics("lineno")[:25]:
+            f.write(f"{stat}\n")
+        if _snapshot is not None:
+            f.write("\nGrowth since the previous snapshot:\n")
+            for stat in snapshot.compare_to(_snapshot, "lineno")[:25]:
+                f.write(f"{stat}\n")
+    _snapshot = snapshot
+    print(f"tracemalloc snapshot written to {PROFILE_DIR}")
+
+
+def install():
+    """Installs the signal handlers and the exit dump (called once at import when enabled)."""
+    atexit.register(dump_sections)
+    if threading.current_thread() is threading.main_thread():
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: start_window())
+        if hasattr(signal, "SIGUSR2"):
+            signal.signal(signal.SIGUSR2, lambda signum, frame: tracemalloc_snapshot())
+    if "tracemalloc" in OPTIONS:
+        import tracemalloc
+
+        tracemalloc.start(25)
+    if "sample" in OPTIONS:
+        start_window()
+
+
+if ENABLED:
+    install()
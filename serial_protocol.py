@@ -0,0 +1,223 @@
+# serial_protocol.py
+import collections
+import struct
+import threading
+import time
+
+# --- Binary frame format ---
+#   SOF1 SOF2 | type (1) | seq (1) | length (1) | payload (length) | CRC-16 (2, little-endian)
+# The CRC (CRC-16/CCITT-FALSE) covers type, seq, length and payload.
+# Start bytes are above 0x7F, so frames can share the line with the ASCII "redTime,direction\n" commands.
+SOF1 = 0xA5
+SOF2 = 0x5A
+
+TYPE_TIMERS = 0x01  # Payload: flags, EW red time, NS red time
+TYPE_ACK = 0x81     # Payload: status
+
+FLAG_EW = 0x01      # The EW red time is valid
+FLAG_NS = 0x02      # The NS red time is valid
+
+ACK_OK = 0
+ACK_BAD_FRAME = 1
+
+MAX_PAYLOAD = 32
+
+
+def crc16(data, crc=0xFFFF):
+    """CRC-16/CCITT-FALSE (polynomial 0x1021, initial value 0xFFFF)."""
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+    return crc
+
+
+def encode_frame(frame_type, seq, payload=b""):
+    """Builds a binary frame."""
+    body = bytes((frame_type, seq & 0xFF, len(payload))) + bytes(payload)
+    return bytes((SOF1, SOF2)) + body + struct.pack("<H", crc16(body))
+
+
+def encode_timers(seq, ew=None, ns=None):
+    """
+    Builds a TIMERS frame carrying the red times of one or both directions.
+
+    Parameters:
+        seq (int): Sequence number (0-255).
+        ew (int): East-West red time, or None if unchanged.
+        ns (int): North-South red time, or None if unchanged.
+    """
+    flags = (FLAG_EW if ew is not None else 0) | (FLAG_NS if ns is not None else 0)
+    payload = bytes((flags, max(0, min(int(ew or 0), 255)), max(0, min(int(ns or 0), 255))))
+    return encode_frame(TYPE_TIMERS, seq, payload)
+
+
+def decode_timers(payload):
+    """Returns (ew, ns) from a TIMERS payload; a direction without its flag is None."""
+    flags, ew, ns = payload[0], payload[1], payload[2]
+    return (ew if flags & FLAG_EW else None), (ns if flags & FLAG_NS else None)
+
+
+class FrameParser:
+    """
+    Incremental parser for a byte stream mixing binary frames and ASCII lines.
+
+    feed() returns a list of events:
+      ("frame", type, seq, payload) for a frame with a valid CRC,
+      ("bad", seq) for a frame with an invalid CRC,
+      ("line", text) for an ASCII line.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        events = []
+        buf = self.buffer
+        while buf:
+            if buf[0] != SOF1:
+                sof = buf.find(SOF1)
+                nl = buf.find(b"\n")
+                if nl >= 0 and (sof < 0 or nl < sof):
+                    events.append(("line", buf[:nl].decode(errors="replace").strip()))
+                    del buf[:nl + 1]
+                    continue
+                if sof < 0:
+                    break  # Partial ASCII line
+                # Text before a frame without a line end is discarded
+                del buf[:sof]
+                continue
+
+            if len(buf) < 5:
+                break
+            if buf[1] != SOF2 or buf[4] > MAX_PAYLOAD:
+                del buf[:1]  # Not a frame start: resynchronize
+                continue
+            length = buf[4]
+            total = 5 + length + 2
+            if len(buf) < total:
+                break
+            body = bytes(buf[2:5 + length])
+            (crc,) = struct.unpack("<H", buf[5 + length:total])
+            if crc == crc16(body):
+                events.append(("frame", body[0], body[1], body[3:]))
+                del buf[:total]
+            else:
+                events.append(("bad", body[1]))
+                del buf[:1]
+        return events
+
+
+class SerialLink:
+    """
+    Sends TIMERS frames over a serial port and tracks their acknowledgements.
+
+    A background thread reads ACK frames and retransmits frames that are not
+    acknowledged within `ack_timeout`. After `retries` retransmissions the frame
+    is dropped and counted as failed; a newer frame supersedes it anyway.
+
+    Parameters:
+        ser (serial.Serial): Open serial port (a read timeout should be set).
+        ack_timeout (float): Seconds to wait for an ACK before retransmitting.
+        retries (int): Maximum number of retransmissions per frame.
+    """
+
+    def __init__(self, ser, ack_timeout=0.25, retries=3):
+        self.ser = ser
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.seq = 0
+        self.pending = {}  # seq -> [frame, first send time, last send time, attempts]
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.parser = FrameParser()
+        self.rtt_ms = collections.deque(maxlen=10000)
+        self.stats = {"sent": 0, "acked": 0, "retransmits": 0, "failed": 0, "nacks": 0, "bytes": 0}
+        self.running = True
+        self.thread = threading.Thread(target=self._reader, daemon=True)
+        self.thread.start()
+
+    def send_timers(self, ew=None, ns=None):
+        """
+        Sends the red times of one or both directions in a single frame.
+
+        Returns:
+            int: Sequence number of the frame.
+        """
+        with self.lock:
+            self.seq = (self.seq + 1) & 0xFF
+            seq = self.seq
+            frame = encode_timers(seq, ew, ns)
+            now = time.monotonic()
+            self.pending[seq] = [frame, now, now, 0]
+            self.stats["sent"] += 1
+        self._write(frame)
+        return seq
+
+    def _write(self, frame):
+        with self.write_lock:
+            self.ser.write(frame)
+        self.stats["bytes"] += len(frame)
+
+    def _reader(self):
+        while self.running:
+            try:
+                data = self.ser.read(self.ser.in_waiting or 1)
+            except Exception as e:
+                print("Serial read error:", e)
+                time.sleep(0.5)
+                continue
+            now = time.monotonic()
+            for event in self.parser.feed(data) if data else ():
+                if event[0] == "frame" and event[1] == TYPE_ACK:
+                    self._on_ack(event[2], event[3], now)
+            self._retransmit(now)
+
+    def _on_ack(self, seq, payload, now):
+        with self.lock:
+            entry = self.pending.get(seq)
+            if entry is None:
+                return
+            if payload and payload[0] != ACK_OK:
+                # The Arduino received a damaged frame: send it again right away
+                self.stats["nacks"] += 1
+                entry[2] = 0
+                return
+            del self.pending[seq]
+            self.stats["acked"] += 1
+            self.rtt_ms.append((now - entry[1]) * 1000)
+
+    def _retransmit(self, now):
+        resend = []
+        with self.lock:
+            for seq, entry in list(self.pending.items()):
+                if now - entry[2] < self.ack_timeout:
+                    continue
+                if entry[3] >= self.retries:
+                    del self.pending[seq]
+                    self.stats["failed"] += 1
+                    continue
+                entry[2] = now
+                entry[3] += 1
+                self.stats["retransmits"] += 1
+                resend.append(entry[0])
+        for frame in resend:
+            self._write(frame)
+
+    def wait_idle(self, timeout=5.0):
+        """Waits until all frames are acknowledged or failed. Returns True if idle."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.pending:
+                    return True
+            time.sleep(0.005)
+        return False
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=2)
@@ -1,4 +1,6 @@
 # simulation.py
+import argparse
+import gc
 import random
 import time
 import threading
@@ -7,7 +9,9 @@ import sys
 import socket
 import json
 
-pygame.init()
+import profiling
+import tracing
+from config import parse_args_with_config
 
 # -------------------------
 # PARAMETERS
@@ -31,7 +35,7 @@ recording_red_phase = False    # True when recording data during the red phase
 speeds = {'car': 2.25, 'bus': 1.8, 'truck': 2.0, 'motorcycle': 2.5}
 directionNumbers = {0: 'east', 1: 'south', 2: 'west', 3: 'north'}
 
-# Initial coordinates for spawning vehicles (these values are adjusted after each vehicle is created)
+# Entry points for spawning vehicles (a vehicle spawns further back if the lane's queue reaches them)
 x = {
     'east':  [0, 0, 0],
     'south': [312, 340, 368],
@@ -91,7 +95,11 @@ movingGap = 10    # Gap between vehicles while moving
 # Vehicle types allowed to spawn
 allowedVehicleTypes = {'car': True, 'bus': True, 'truck': True, 'motorcycle': True}
 allowedVehicleTypesList = []
-simulation = pygame.sprite.Group()  # Group for all vehicle sprites
+simulation = []  # All vehicles on screen, in spawn order
+# Held by the main loop while it adds, moves or removes vehicles, and by the
+# update thread while it counts them
+vehiclesLock = threading.Lock()
+vehicleImages = {}  # Shared vehicle images by (direction, vehicle type)
 
 # Vehicle spawn delays (in seconds)
 spawn_delays = [1.0, 2.0, 3.0]
@@ -101,6 +109,28 @@ vehicleGenerationDelay = spawn_delays[current_spawn_index]
 # Vehicle multiplier: each simulated vehicle represents multiple real vehicles
 vehicleMultiplier = 3
 
+# Address of the control server (control.py)
+controlHost = 'localhost'
+controlPort = 12345
+
+# Intersection id sent with each sample (None: the controller's default intersection)
+intersectionName = None
+
+# Updates are pushed to the control server when the vehicle counts or the signal
+# timers change (set stateChanged), at most every updateMinInterval seconds and
+# at least every updateMaxInterval seconds
+updateMinInterval = 0.1
+updateMaxInterval = 5.0
+stateChanged = threading.Event()
+controlSocket = None  # Persistent connection to the control server
+
+# Shared-memory state bus used instead of TCP when control.py runs on the same host (--bus)
+stateBus = None
+busSlot = 0
+
+# Seconds between two vehicle memory/allocation reports (0: no reports)
+statsInterval = 60
+
 # -------------------------------------------------------------------
 # FUNCTION: Count the number of vehicles on a lane based on position
 # -------------------------------------------------------------------
@@ -112,8 +142,7 @@ def countVehiclesOnLane(direction, lane):
         bottom = center + LANE_THICKNESS / 2
         for v in simulation:
             if v.direction == direction and v.lane == lane:
-                w, h = v.image.get_size()
-                if (v.y + h > top) and (v.y < bottom):
+                if (v.y + v.height > top) and (v.y < bottom):
                     count += 1
     else:
         center = laneCenters[direction][lane]
@@ -121,8 +150,7 @@ def countVehiclesOnLane(direction, lane):
         right = center + LANE_THICKNESS / 2
         for v in simulation:
             if v.direction == direction and v.lane == lane:
-                w, h = v.image.get_size()
-                if (v.x + w > left) and (v.x < right):
+                if (v.x + v.width > left) and (v.x < right):
                     count += 1
     return count
 
@@ -138,64 +166,145 @@ def countVehicleTypesOnDirection(direction):
     return counts
 
 # -------------------------------------------------------------------
-# FUNCTION: Send/Receive traffic signal data from the control server
+# FUNCTION: Build the sample sent to the control server
 # -------------------------------------------------------------------
-def update_signal_timings():
-    global EWgreen, NSgreen, EWred, NSred, phase_start_signal
-    
+def build_sample():
     directions = ['east', 'south', 'west', 'north']
     data = {}
-    for d in directions:
-        counts = countVehicleTypesOnDirection(d)
-        # Scale the counts by the vehicle multiplier
-        scaled_counts = {k: vehicleMultiplier * v for k, v in counts.items()}
-        data[d] = scaled_counts
-        
-    # Send data based on the current phase; note that we send the simulation's red_time (managed internally)
+    with vehiclesLock:
+        for d in directions:
+            counts = countVehicleTypesOnDirection(d)
+            # Scale the counts by the vehicle multiplier
+            scaled_counts = {k: vehicleMultiplier * v for k, v in counts.items()}
+            data[d] = scaled_counts
+
+    # Note that we send the simulation's red_time (managed internally)
     data["phase_start"] = phase_start_signal
     data["red_time_eastwest"] = EWred
     data["red_time_northsouth"] = NSred
+    if intersectionName is not None:
+        data["intersection"] = intersectionName
+    return data
+
+# -------------------------------------------------------------------
+# FUNCTION: Apply the timings computed by the control server
+# -------------------------------------------------------------------
+def apply_timings(timings):
+    global EWgreen, NSgreen, EWred, NSred
+    # Update both green and red signal values from the control server
+    new_EWgreen = timings.get("eastwest_green", None)
+    new_NSgreen = timings.get("northsouth_green", None)
+    new_EWred   = timings.get("eastwest_red", None)
+    new_NSred   = timings.get("northsouth_red", None)
+
+    # Only update if the current signals are in a waiting state (equal to 0)
+    if new_EWgreen is not None and new_EWgreen >= 15 and EWgreen == 0:
+        EWgreen = new_EWgreen
+        NSred = new_EWred if new_EWred is not None else EWgreen + yellowTime
+    if new_NSgreen is not None and new_NSgreen >= 15 and NSgreen == 0:
+        NSgreen = new_NSgreen
+        EWred = new_NSred if new_NSred is not None else NSgreen + yellowTime
+
+    print("(external):", timings)
 
+# -------------------------------------------------------------------
+# THREAD FUNCTION: Apply the responses arriving on the control connection
+# -------------------------------------------------------------------
+def read_responses(sock):
+    global controlSocket
+    buffer = b""
     try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.connect(('localhost', 12345))
-        s.sendall(json.dumps(data).encode())
-        response = s.recv(4096)
-        s.close()
-        timings = json.loads(response.decode())
-        # Update both green and red signal values from the control server
-        new_EWgreen = timings.get("eastwest_green", None)
-        new_NSgreen = timings.get("northsouth_green", None)
-        new_EWred   = timings.get("eastwest_red", None)
-        new_NSred   = timings.get("northsouth_red", None)
-        
-        # Only update if the current signals are in a waiting state (equal to 0)
-        if new_EWgreen is not None and new_EWgreen >= 15 and EWgreen == 0:
-            EWgreen = new_EWgreen
-            NSred = new_EWred if new_EWred is not None else EWgreen + yellowTime
-        if new_NSgreen is not None and new_NSgreen >= 15 and NSgreen == 0:
-            NSgreen = new_NSgreen
-            EWred = new_NSred if new_NSred is not None else NSgreen + yellowTime
-
-        print("(external):", timings)
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                if line.strip():
+                    apply_timings(json.loads(line.decode()))
+    except (OSError, ValueError) as e:
+        print("Error reading signal timings:", e)
+    print("Connection to the control server closed")
+    sock.close()
+    if controlSocket is sock:
+        controlSocket = None
+
+# -------------------------------------------------------------------
+# FUNCTION: Send traffic signal data to the control server
+# -------------------------------------------------------------------
+@profiling.timed("update_signal_timings")
+def update_signal_timings(data, trace=None):
+    global controlSocket
+    try:
+        if stateBus is not None:
+            # The shared-memory round trip is short enough to wait for the response
+            apply_timings(stateBus.exchange(busSlot, data))
+            return
+        # One persistent connection: the responses are applied by read_responses()
+        # as they arrive, so sending never waits for the controller
+        if controlSocket is None:
+            sock = socket.create_connection((controlHost, controlPort), timeout=5)
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            controlSocket = sock
+            threading.Thread(target=read_responses, args=(sock,), daemon=True).start()
+        if trace is not None:
+            tracing.stamp(trace, "send")
+            data = dict(data, trace=trace)
+        controlSocket.sendall((json.dumps(data, separators=(",", ":")) + "\n").encode())
     except Exception as e:
         print("Error updating signal timings:", e)
+        if controlSocket is not None:
+            controlSocket.close()
+            controlSocket = None
 
 # -------------------------------------------------------------------
-# THREAD FUNCTION: Continuously update signal timings every second
+# THREAD FUNCTION: Push an update when the counts or the signal timers change
 # -------------------------------------------------------------------
 def signal_update_thread():
+    last_data = None
+    last_time = 0.0
     while True:
-        update_signal_timings()
-        time.sleep(1)
+        # Wake up on a change, or when the maximum interval has passed
+        stateChanged.wait(max(0.0, last_time + updateMaxInterval - time.monotonic()))
+        # With tracing enabled, the trace of the update starts at the change
+        trace = tracing.start("sim", "change")
+        # Changes within the minimum interval are merged into one update
+        delay = last_time + updateMinInterval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        stateChanged.clear()
+        data = build_sample()
+        if data == last_data and time.monotonic() - last_time < updateMaxInterval:
+            continue
+        update_signal_timings(data, trace)
+        last_data = data
+        last_time = time.monotonic()
+
+# -------------------------------------------------------------------
+# FUNCTION: Shared vehicle images
+# -------------------------------------------------------------------
+def vehicleImage(direction, vehicleClass):
+    # Each image is loaded once and shared by all vehicles of its direction and type
+    image = vehicleImages.get((direction, vehicleClass))
+    if image is None:
+        image = vehicleImages[(direction, vehicleClass)] = pygame.image.load(f"images/{direction}/{vehicleClass}.png")
+    return image
 
 # -------------------------------------------------------------------
 # CLASS: Vehicle
-# Represents a vehicle sprite in the simulation.
+# Represents a vehicle in the simulation. Vehicles use __slots__ (no per-instance
+# dict) and the shared images, and are recycled by the VehiclePool.
 # -------------------------------------------------------------------
-class Vehicle(pygame.sprite.Sprite):
+class Vehicle:
+    __slots__ = ('lane', 'vehicleClass', 'speed', 'dir_number', 'direction', 'crossed',
+                 'image', 'width', 'height', 'x', 'y', 'stop')
+
     def __init__(self, lane, vehicleClass, dir_number, direction):
-        super().__init__()
+        self.spawn(lane, vehicleClass, dir_number, direction)
+
+    def spawn(self, lane, vehicleClass, dir_number, direction):
         self.lane = lane
         self.vehicleClass = vehicleClass
         self.speed = speeds[vehicleClass]
@@ -203,17 +312,26 @@ class Vehicle(pygame.sprite.Sprite):
         self.direction = direction
         self.crossed = 0  # Flag indicating whether the vehicle has crossed the stop line
 
-        # Load the vehicle image based on its type and direction
-        path = f"images/{direction}/{vehicleClass}.png"
-        self.image = pygame.image.load(path)
-        rect = self.image.get_rect()
+        self.image = vehicleImage(direction, vehicleClass)
+        self.width, self.height = self.image.get_size()
 
-        # Set initial position based on the spawn coordinates
+        # Spawn at the lane's entry point, or behind the last vehicle of the lane
+        # if the queue reaches back past it
+        lane_vehicles = vehicles[direction][lane]
         self.x = x[direction][lane]
         self.y = y[direction][lane]
+        if lane_vehicles:
+            last = lane_vehicles[-1]
+            if direction == 'east':
+                self.x = min(self.x, last.x - self.width - stoppingGap)
+            elif direction == 'west':
+                self.x = max(self.x, last.x + last.width + stoppingGap)
+            elif direction == 'south':
+                self.y = min(self.y, last.y - self.height - stoppingGap)
+            elif direction == 'north':
+                self.y = max(self.y, last.y + last.height + stoppingGap)
 
         # Append this vehicle to the corresponding lane list
-        lane_vehicles = vehicles[direction][lane]
         lane_vehicles.append(self)
 
         # Determine the stopping position based on preceding vehicle in the lane
@@ -221,52 +339,49 @@ class Vehicle(pygame.sprite.Sprite):
             prev = lane_vehicles[-2]
             if prev.crossed == 0:
                 if direction == 'east':
-                    self.stop = prev.stop - rect.width - stoppingGap
+                    self.stop = prev.stop - self.width - stoppingGap
                 elif direction == 'west':
-                    self.stop = prev.stop + rect.width + stoppingGap
+                    self.stop = prev.stop + self.width + stoppingGap
                 elif direction == 'south':
-                    self.stop = prev.stop - rect.height - stoppingGap
+                    self.stop = prev.stop - self.height - stoppingGap
                 elif direction == 'north':
-                    self.stop = prev.stop + rect.height + stoppingGap
+                    self.stop = prev.stop + self.height + stoppingGap
             else:
                 self.stop = defaultStop[direction]
         else:
             self.stop = defaultStop[direction]
 
-        # Update the spawn coordinate for the next vehicle in the lane
-        if direction == 'east':
-            x[direction][lane] -= (rect.width + stoppingGap)
-        elif direction == 'west':
-            x[direction][lane] += (rect.width + stoppingGap)
-        elif direction == 'south':
-            y[direction][lane] -= (rect.height + stoppingGap)
-        elif direction == 'north':
-            y[direction][lane] += (rect.height + stoppingGap)
+        simulation.append(self)
+        stateChanged.set()
 
-        simulation.add(self)
+    def remove(self):
+        simulation.remove(self)
+        lane_vehicles = vehicles[self.direction][self.lane]
+        if self in lane_vehicles:
+            lane_vehicles.remove(self)
+        vehiclePool.release(self)
+        stateChanged.set()
 
+    @profiling.timed("Vehicle.move")
     def move(self):
-        rect = self.image.get_rect()
         lane_vehicles = vehicles[self.direction][self.lane]
 
         margin = 50
         screen_width, screen_height = 800, 800
-        # Remove the vehicle if it moves out of screen bounds (with a margin)
+        # Recycle the vehicle if it moves out of screen bounds (with a margin)
         if ((self.direction == 'east' and self.x > screen_width + margin) or
-            (self.direction == 'west' and self.x + rect.width < -margin) or
+            (self.direction == 'west' and self.x + self.width < -margin) or
             (self.direction == 'south' and self.y > screen_height + margin) or
-            (self.direction == 'north' and self.y + rect.height < -margin)):
-            simulation.remove(self)
-            if self in lane_vehicles:
-                lane_vehicles.remove(self)
+            (self.direction == 'north' and self.y + self.height < -margin)):
+            self.remove()
             return
 
         # Movement logic based on direction and current signal state
         if self.direction == 'east':
             if self.crossed == 0:
-                if (self.x + rect.width) > stopLines['east']:
+                if (self.x + self.width) > stopLines['east']:
                     self.crossed = 1
-                if ((self.x + rect.width <= self.stop) or (EWgreen > 0 and NSyellow == 0) or EWyellow > 0):
+                if ((self.x + self.width <= self.stop) or (EWgreen > 0 and NSyellow == 0) or EWyellow > 0):
                     self._moveForward(lane_vehicles, axis='x', step=self.speed, forward=True)
             else:
                 self._moveForward(lane_vehicles, axis='x', step=self.speed, forward=True)
@@ -280,9 +395,9 @@ class Vehicle(pygame.sprite.Sprite):
                 self._moveForward(lane_vehicles, axis='x', step=-self.speed, forward=False)
         elif self.direction == 'south':
             if self.crossed == 0:
-                if (self.y + rect.height) > stopLines['south']:
+                if (self.y + self.height) > stopLines['south']:
                     self.crossed = 1
-                if ((self.y + rect.height <= self.stop) or (NSgreen > 0 and EWyellow == 0) or NSyellow > 0):
+                if ((self.y + self.height <= self.stop) or (NSgreen > 0 and EWyellow == 0) or NSyellow > 0):
                     self._moveForward(lane_vehicles, axis='y', step=self.speed, forward=True)
             else:
                 self._moveForward(lane_vehicles, axis='y', step=self.speed, forward=True)
@@ -304,23 +419,66 @@ class Vehicle(pygame.sprite.Sprite):
                 self.y += step
         else:
             front_car = lane_vehicles[idx - 1]
-            rect_self = self.image.get_rect()
-            rect_front = front_car.image.get_rect()
             if axis == 'x':
                 if forward:
-                    if (self.x + rect_self.width) < (front_car.x - movingGap):
+                    if (self.x + self.width) < (front_car.x - movingGap):
                         self.x += step
                 else:
-                    if self.x > (front_car.x + rect_front.width + movingGap):
+                    if self.x > (front_car.x + front_car.width + movingGap):
                         self.x += step
             else:
                 if forward:
-                    if (self.y + rect_self.height) < (front_car.y - movingGap):
+                    if (self.y + self.height) < (front_car.y - movingGap):
                         self.y += step
                 else:
-                    if self.y > (front_car.y + rect_front.height + movingGap):
+                    if self.y > (front_car.y + front_car.height + movingGap):
                         self.y += step
 
+# -------------------------------------------------------------------
+# CLASS: VehiclePool
+# Recycles the vehicles that left the screen, so that a long run stops
+# allocating once the number of vehicles on screen has peaked.
+# -------------------------------------------------------------------
+class VehiclePool:
+    def __init__(self):
+        self.free = []
+        self.allocated = 0  # Vehicle objects created
+        self.reused = 0     # Vehicles taken from the pool
+        self.lastReport = (time.time(), 0, 0, 0)
+
+    def acquire(self, lane, vehicleClass, dir_number, direction):
+        if self.free:
+            vehicle = self.free.pop()
+            vehicle.spawn(lane, vehicleClass, dir_number, direction)
+            self.reused += 1
+        else:
+            vehicle = Vehicle(lane, vehicleClass, dir_number, direction)
+            self.allocated += 1
+        return vehicle
+
+    def release(self, vehicle):
+        self.free.append(vehicle)
+
+    def report(self):
+        # Prints the vehicles in use, the allocations and reuses per second since the
+        # last report, the memory per vehicle and the full garbage collections
+        now = time.time()
+        collections = gc.get_stats()[2]["collections"]
+        last_time, last_allocated, last_reused, last_collections = self.lastReport
+        elapsed = max(now - last_time, 1e-9)
+        self.lastReport = (now, self.allocated, self.reused, collections)
+        sample = simulation[0] if simulation else (self.free[0] if self.free else None)
+        # The instance and its own float coordinates; the images are shared
+        per_vehicle = sum(sys.getsizeof(v) for v in (sample, sample.x, sample.y, sample.stop)) if sample else 0
+        image_bytes = sum(img.get_width() * img.get_height() * img.get_bytesize() for img in vehicleImages.values())
+        print(f"Vehicles: {len(simulation)} active, {len(self.free)} pooled, {self.allocated} allocated | "
+              f"{(self.allocated - last_allocated) / elapsed:.2f} allocations/s, "
+              f"{(self.reused - last_reused) / elapsed:.2f} reuses/s | "
+              f"{per_vehicle} B/vehicle, {image_bytes / 1024:.0f} KiB shared images | "
+              f"{collections - last_collections} full GCs")
+
+vehiclePool = VehiclePool()
+
 # -------------------------------------------------------------------
 # FUNCTION: Handle the traffic light cycle
 # -------------------------------------------------------------------
@@ -333,14 +491,17 @@ def lightCycle():
                 time.sleep(1)
                 NSgreen -= 1
                 EWred -= 1
+                stateChanged.set()
 
             NSyellow = yellowTime
             EWred = yellowTime
+            stateChanged.set()
 
             while NSyellow > 0:
                 time.sleep(1)
                 NSyellow -= 1
                 EWred -= 1
+                stateChanged.set()
 
         # Case: East-West is green and North-South is red
         elif EWgreen > 0 and NSred > 0:
@@ -348,14 +509,17 @@ def lightCycle():
                 time.sleep(1)
                 EWgreen -= 1
                 NSred -= 1
+                stateChanged.set()
                 
             EWyellow = yellowTime
             NSred = yellowTime
+            stateChanged.set()
             
             while EWyellow > 0:
                 time.sleep(1)
                 EWyellow -= 1
                 NSred -= 1
+                stateChanged.set()
 
         else:
             # If no new signals are received, wait 1 second and re-check
@@ -378,11 +542,12 @@ def createVehicle():
     else:
         direction_number = 3  # north
     dir_str = directionNumbers[direction_number]
-    Vehicle(lane_number, vehicleTypes[vehicle_type], direction_number, dir_str)
+    vehiclePool.acquire(lane_number, vehicleTypes[vehicle_type], direction_number, dir_str)
 
 # -------------------------------------------------------------------
 # FUNCTION: Draw traffic signals and their timers on the screen
 # -------------------------------------------------------------------
+@profiling.timed("drawSignals")
 def drawSignals(screen, font, white, black, red_vert, yellow_vert, green_vert):
     for i in range(4):
         direction = directionNumbers[i]
@@ -462,14 +627,61 @@ def drawVehicleTypeCounts(screen, font, white, black):
 # -------------------------------------------------------------------
 # MAIN FUNCTION
 # -------------------------------------------------------------------
+def parse_args(argv=None):
+    """
+    Parses the command line. Options can also come from a JSON config file given
+    with --config (keys are the option names); command line options take precedence.
+    """
+    parser = argparse.ArgumentParser(description="Traffic intersection simulation")
+    parser.add_argument("--host", default=controlHost, help="Control server host")
+    parser.add_argument("--port", type=int, default=controlPort, help="Control server port")
+    parser.add_argument("--intersection", help="Intersection id sent to the controller")
+    parser.add_argument("--bus", metavar="NAME",
+                        help="Exchange data with a control.py started with --bus NAME through shared memory")
+    parser.add_argument("--bus-slot", type=int, default=0, help="Slot of this intersection on the state bus (one per intersection)")
+    parser.add_argument("--multiplier", type=int, default=vehicleMultiplier,
+                        help="Real vehicles represented by each simulated vehicle")
+    parser.add_argument("--spawn-delay", type=int, default=current_spawn_index, choices=range(len(spawn_delays)),
+                        help="Index into the spawn delays %s" % spawn_delays)
+    parser.add_argument("--min-interval", type=float, default=updateMinInterval,
+                        help="Minimum seconds between two updates sent to the control server")
+    parser.add_argument("--max-interval", type=float, default=updateMaxInterval,
+                        help="Seconds after which an update is sent even if nothing changed")
+    parser.add_argument("--stats-interval", type=float, default=statsInterval,
+                        help="Seconds between vehicle memory/allocation reports (0 disables them)")
+    return parse_args_with_config(parser, argv)
+
 def main():
     global allowedVehicleTypesList, vehicleGenerationDelay, current_spawn_index, vehicleMultiplier
+    global controlHost, controlPort, intersectionName, stateBus, busSlot, statsInterval
+    global updateMinInterval, updateMaxInterval
+    args = parse_args()
+    updateMinInterval, updateMaxInterval = args.min_interval, args.max_interval
+    statsInterval = args.stats_interval
+    controlHost, controlPort = args.host, args.port
+    intersectionName = args.intersection
+    if args.bus:
+        from state_bus import StateBus
+
+        stateBus = StateBus(args.bus)
+        busSlot = args.bus_slot
+        if intersectionName is not None:
+            stateBus.set_name(busSlot, intersectionName)
+    vehicleMultiplier = args.multiplier
+    current_spawn_index = args.spawn_delay
+    vehicleGenerationDelay = spawn_delays[current_spawn_index]
+
+    # Only the display and font modules are used; skipping the audio/joystick
+    # subsystems of pygame.init() shortens startup
+    pygame.display.init()
+    pygame.font.init()
+
     # Build the list of allowed vehicle types based on configuration
     for i, vtype in enumerate(allowedVehicleTypes):
         if allowedVehicleTypes[vtype]:
             allowedVehicleTypesList.append(i)
 
-    # Start the thread for receiving control data and the traffic light cycle thread
+    # Start the thread pushing updates to the control server and the traffic light cycle thread
     threading.Thread(target=signal_update_thread, daemon=True).start()
     threading.Thread(target=lightCycle, daemon=True).start()
 
@@ -488,6 +700,7 @@ def main():
     clock = pygame.time.Clock()
 
     last_spawn_time = time.time()
+    last_stats_time = last_spawn_time
 
     while True:
         dt = clock.tick(60) / 1000.0
@@ -515,6 +728,7 @@ def main():
                         pygame.K_5: 5,
                     }
                     vehicleMultiplier = key_mapping[event.key]
+                    stateChanged.set()
 
         if not pygame.display.get_active():
             pygame.time.wait(100)
@@ -522,8 +736,12 @@ def main():
 
         current_time = time.time()
         if current_time - last_spawn_time >= vehicleGenerationDelay:
-            createVehicle()
+            with vehiclesLock:
+                createVehicle()
             last_spawn_time = current_time
+        if statsInterval and current_time - last_stats_time >= statsInterval:
+            vehiclePool.report()
+            last_stats_time = current_time
 
         screen.blit(background, (0, 0))
         elapsed = int(time.time() - start_time)
@@ -544,9 +762,16 @@ def main():
         drawVehicleTypeCounts(screen, font, white, black)
         drawSignals(screen, font, white, black, red_vert, yellow_vert, green_vert)
 
-        for v in simulation:
-            v.move()
-            screen.blit(v.image, (v.x, v.y))
+        # Index loop instead of iterating a copy: a vehicle leaving the screen
+        # removes itself, and the next one moves into its index
+        with vehiclesLock:
+            i = 0
+            while i < len(simulation):
+                v = simulation[i]
+                v.move()
+                if i < len(simulation) and simulation[i] is v:
+                    screen.blit(v.image, (v.x, v.y))
+                    i += 1
 
         try:
             pygame.display.update()
@@ -0,0 +1,310 @@
+# state_bus.py
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MAGIC = 0x54534231  # "TSB1"
+VERSION = 2
+# Reads a seqlock gives up after: the writer may have been killed halfway
+SPIN_LIMIT = 1000
+
+DIRECTIONS = ('east', 'south', 'west', 'north')
+VEHICLE_TYPES = ('car', 'bus', 'truck', 'motorcycle')
+TIMER_KEYS = ("eastwest_green", "northsouth_green", "eastwest_red", "northsouth_red")
+# Response statuses; "signals" is a response carrying computed timers
+STATUSES = ("ignored", "recording", "waiting", "signals")
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "<u4"),
+    ("version", "<u2"),
+    ("slots", "<u2"),
+], align=True)
+
+SLOT_DTYPE = np.dtype([
+    ("owner", "<i4"),                            # PID of the client using the slot (0: free)
+    # Written by the simulation
+    ("in_seq", "<u8"),                           # Seqlock: odd while the sample is written
+    ("name", "S32"),                             # Intersection id (empty: default)
+    ("counts", "<i4", (len(DIRECTIONS), len(VEHICLE_TYPES))),
+    ("red", "<i4", (2,)),                        # red_time_eastwest, red_time_northsouth
+    ("phase_start", "<i4"),
+    # Written by the controller
+    ("out_seq", "<u8"),                          # Seqlock: odd while the response is written
+    ("reply_to", "<u8"),                         # in_seq of the sample the response answers
+    ("status", "<i4"),
+    ("timers", "<i4", (len(TIMER_KEYS),)),       # -1 where the response has no value
+], align=True)
+
+
+def _attach(name):
+    """
+    Attaches to an existing segment without registering it with this process's
+    resource tracker, which would unlink it when the client exits (Python < 3.13).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _alive(pid):
+    """Tells whether a process exists (os.kill(pid, 0) would terminate it on Windows)."""
+    if os.name == "nt":
+        import ctypes
+
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class StateBus:
+    """
+    Same-host transport between the simulation(s) and control.py in shared memory.
+
+    The segment has a header and one fixed-layout slot per intersection. A client
+    (simulation.py or headless_sim.py) writes the count vectors and red timers of
+    its intersection into its slot; control.py polls the slots' sequence counters
+    (one vectorized comparison), processes the changed slots and writes the
+    responses back into the same slots. Each half of a slot has a single writer and
+    is protected by its sequence counter (seqlock): the writer makes it odd while
+    writing, and readers retry when it is odd or changed while they copied. Readers
+    give up after SPIN_LIMIT retries, so a slot left odd by a killed client cannot
+    block the controller.
+
+    Each slot belongs to one client process: the first publish() claims it, and
+    publishing to a slot claimed by another running process raises ValueError.
+
+    Parameters:
+        name (str): Name of the shared memory segment.
+        slots (int): Number of intersection slots (only used when creating).
+        create (bool): Create the segment (control.py) or attach to an existing one.
+    """
+
+    def __init__(self, name, slots=64, create=False):
+        self.pid = os.getpid()
+        self.names = {}  # slot -> intersection id written with its samples
+        self.claimed = set()
+        if create:
+            size = HEADER_DTYPE.itemsize + slots * SLOT_DTYPE.itemsize
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = _attach(name)
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        if create:
+            self.header["slots"] = slots
+            self.header["magic"] = MAGIC
+            self.header["version"] = VERSION
+        elif self.header["magic"] != MAGIC or self.header["version"] != VERSION:
+            self.close()
+            raise ValueError(f"Shared memory segment {name!r} is not a version {VERSION} state bus")
+        self.name = self.shm.name
+        self.nslots = int(self.header["slots"])
+        self.slots = np.ndarray((self.nslots,), dtype=SLOT_DTYPE, buffer=self.shm.buf,
+                                offset=HEADER_DTYPE.itemsize)
+        if create:
+            self.slots["timers"] = -1
+
+    def close(self, unlink=False):
+        # Release our slots, then drop the numpy views before closing, otherwise the
+        # buffer is still exported
+        for slot in self.claimed:
+            if int(self.slots[slot]["owner"]) == self.pid:
+                self.slots[slot]["owner"] = 0
+        self.header = self.slots = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+    # --- Client side (simulation) ---
+
+    def claim(self, slot):
+        """
+        Makes this process the owner of a slot.
+
+        Raises:
+            ValueError: If another running process owns the slot.
+        """
+        owner = int(self.slots[slot]["owner"])
+        if owner not in (0, self.pid) and _alive(owner):
+            raise ValueError(f"Bus slot {slot} is used by process {owner}; give each intersection its own slot")
+        self.slots[slot]["owner"] = self.pid
+        self.claimed.add(slot)
+
+    def set_name(self, slot, name):
+        """
+        Sets the intersection id of a slot (defaults to control.py's default intersection).
+        It is written with the next sample.
+        """
+        self.names[slot] = name.encode()[:32]
+
+    def publish(self, slot, data):
+        """
+        Writes a sample (the dict simulation.py would send over TCP) into a slot.
+
+        Returns:
+            int: Sequence number of the sample (see wait_response()).
+        """
+        s = self.slots[slot]
+        if int(s["owner"]) != self.pid:
+            # First sample, or another process took the slot over
+            self.claim(slot)
+        seq = int(s["in_seq"])
+        if seq & 1:
+            seq += 1  # Left half-written by a killed client
+        s["in_seq"] = seq + 1
+        s["name"] = self.names.get(slot, b"")
+        counts = s["counts"]
+        for i, d in enumerate(DIRECTIONS):
+            direction = data.get(d, {})
+            for j, k in enumerate(VEHICLE_TYPES):
+                counts[i, j] = direction.get(k, 0)
+        s["red"] = (data.get("red_time_eastwest", -1), data.get("red_time_northsouth", -1))
+        s["phase_start"] = data.get("phase_start", 0)
+        s["in_seq"] = seq + 2
+        return seq + 2
+
+    def response(self, slot, seq):
+        """Returns the response to sample `seq` if it is available, else None."""
+        s = self.slots[slot]
+        for _ in range(SPIN_LIMIT):
+            out_seq = int(s["out_seq"])
+            if out_seq & 1:
+                continue
+            reply_to = int(s["reply_to"])
+            status = int(s["status"])
+            timers = s["timers"].copy()
+            if int(s["out_seq"]) == out_seq:
+                break
+        else:
+            return None  # Still being written; wait_response() polls again
+        if reply_to < seq:
+            return None
+        if STATUSES[status] != "signals":
+            return {"status": STATUSES[status]}
+        return {k: int(v) for k, v in zip(TIMER_KEYS, timers) if v >= 0}
+
+    def wait_response(self, slot, seq, timeout=1.0, poll=0.0002):
+        """
+        Waits for the response to sample `seq`.
+
+        Raises:
+            TimeoutError: If no response arrives within `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            result = self.response(slot, seq)
+            if result is not None:
+                return result
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No response from the controller on bus slot {slot}")
+            time.sleep(poll)
+
+    def exchange(self, slot, data, timeout=1.0):
+        """Publishes a sample and waits for the controller's response."""
+        return self.wait_response(slot, self.publish(slot, data), timeout)
+
+    # --- Controller side ---
+
+    def read_sample(self, slot):
+        """
+        Reads the latest sample of a slot.
+
+        Returns:
+            tuple: (sequence number, dict in the format of the TCP protocol),
+                   (0, None) if nothing was published yet, or (sequence number,
+                   None) if no consistent copy was read within SPIN_LIMIT retries.
+        """
+        s = self.slots[slot]
+        for _ in range(SPIN_LIMIT):
+            seq = int(s["in_seq"])
+            if seq & 1:
+                continue
+            name = bytes(s["name"])
+            counts = s["counts"].copy()
+            red = s["red"].copy()
+            phase_start = int(s["phase_start"])
+            if int(s["in_seq"]) == seq:
+                break
+        else:
+            return seq, None
+        if seq == 0:
+            return 0, None
+        data = {d: dict(zip(VEHICLE_TYPES, counts[i].tolist())) for i, d in enumerate(DIRECTIONS)}
+        data["phase_start"] = phase_start
+        if red[0] >= 0:
+            data["red_time_eastwest"] = int(red[0])
+        if red[1] >= 0:
+            data["red_time_northsouth"] = int(red[1])
+        if name:
+            data["intersection"] = name.decode(errors="replace")
+        return seq, data
+
+    def write_response(self, slot, seq, result):
+        """Writes the controller's response (the dict process_data() returned) to sample `seq`."""
+        s = self.slots[slot]
+        out_seq = int(s["out_seq"])
+        s["out_seq"] = out_seq + 1
+        timers = [result.get(k, -1) for k in TIMER_KEYS]
+        if any(t >= 0 for t in timers):
+            s["status"] = STATUSES.index("signals")
+        else:
+            s["status"] = STATUSES.index(result.get("status", "waiting"))
+        s["timers"] = timers
+        s["reply_to"] = seq
+        s["out_seq"] = out_seq + 2
+
+    def pending(self, seen):
+        """
+        Returns the indices of the slots whose sample changed since `seen`.
+
+        Parameters:
+            seen (numpy.ndarray): in_seq of each slot when it was last processed.
+        """
+        return np.nonzero(self.slots["in_seq"] != seen)[0]
+
+
+def serve(bus, handle, stop=None, idle_sleep=0.005, busy_sleep=0.0002):
+    """
+    Controller loop: answers the samples published on a bus.
+
+    Right after activity it polls every `busy_sleep` seconds and backs off to
+    `idle_sleep` when the bus has been quiet for a second.
+
+    Parameters:
+        bus (StateBus): The bus (created by the controller).
+        handle (callable): handle(data) -> response dict, called for each new sample.
+        stop (threading.Event): Stops the loop when set.
+    """
+    seen = np.zeros(bus.nslots, dtype=np.uint64)
+    last_activity = time.monotonic()
+    while stop is None or not stop.is_set():
+        changed = bus.pending(seen)
+        if len(changed) == 0:
+            quiet = time.monotonic() - last_activity > 1.0
+            time.sleep(idle_sleep if quiet else busy_sleep)
+            continue
+        last_activity = time.monotonic()
+        for slot in changed:
+            seq, data = bus.read_sample(slot)
+            if data is None and seq & 1:
+                # Half-written: skip the slot until its writer publishes again
+                print(f"State bus slot {slot} is stuck mid-write (client killed?); skipped")
+            seen[slot] = seq
+            if data is None:
+                continue
+            bus.write_response(slot, seq, handle(data))
@@ -0,0 +1,53 @@
+# test_control.py
+import time
+
+import control
+
+
+def test_decode_messages_newline_delimited():
+    messages, rest = control.decode_messages('{"a": 1}\n{"b": 2}\n')
+    assert messages == [{"a": 1}, {"b": 2}]
+    assert rest == ""
+
+
+def test_decode_messages_keeps_partial_message():
+    messages, rest = control.decode_messages('{"a": 1}\n{"b": ')
+    assert messages == [{"a": 1}]
+    assert rest == '{"b": '
+    messages, rest = control.decode_messages(rest + '2}\n')
+    assert messages == [{"b": 2}]
+    assert rest == ""
+
+
+def test_decode_messages_without_terminator():
+    assert control.decode_messages('{"red_time_eastwest": 3}') == ([{"red_time_eastwest": 3}], "")
+
+
+def test_decode_messages_skips_malformed_line():
+    messages, rest = control.decode_messages('{"a": }\n{"b": 2}\n')
+    assert messages == [{"b": 2}]
+    assert rest == ""
+
+
+def test_merge_camera_counts_uses_recent_counts_only(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(control, "camera_counts", {
+        (control.DEFAULT_INTERSECTION, "east"): ({"car": 5}, now),
+        (control.DEFAULT_INTERSECTION, "west"): ({"car": 7}, now - control.camera_max_age - 1),
+        ("other", "north"): ({"car": 9}, now),
+    })
+    data = {"east": {"car": 1}, "west": {"car": 2}, "north": {"car": 3}, "red_time_eastwest": 10}
+    merged = control.merge_camera_counts(data)
+    assert merged["east"] == {"car": 5}
+    assert merged["west"] == {"car": 2}   # Too old
+    assert merged["north"] == {"car": 3}  # Other intersection
+    assert data["east"] == {"car": 1}     # The sample itself is not changed
+
+
+def test_sample_error():
+    assert control.sample_error({"east": {"car": 2}, "red_time_eastwest": 10, "red_time_northsouth": 0}) is None
+    assert control.sample_error({"red_time_eastwest": "a"}) is not None
+    assert control.sample_error({"red_time_eastwest": True}) is not None
+    assert control.sample_error({"east": {"car": "x"}}) is not None
+    assert control.sample_error({"east": [1]}) is not None
+    assert control.sample_error({"intersection": ["a"]}) is not None
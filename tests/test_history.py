@@ -0,0 +1,46 @@
+# test_history.py
+import pytest
+
+from history import History
+
+
+def make_history():
+    history = History()
+    for i in range(10):
+        history.add_sample({"east": {"car": i}, "north": {"bus": 1},
+                            "red_time_eastwest": 10 - i, "red_time_northsouth": 0}, t=1000.0 + i)
+    return history
+
+
+def test_query_samples():
+    result = make_history().query("samples", 1000.0, 1009.0, bins=2)
+    assert result["resolution"] == "1s"
+    assert result["samples"] == 10
+    assert result["flow_eastwest"] == {"mean": 4.5, "max": 9.0}
+    assert result["flow_northsouth"] == {"mean": 2.0, "max": 2.0}
+    assert [b["mean"][0] for b in result["bins"]] == [2.0, 7.0]
+
+
+def test_query_sample_range():
+    result = make_history().query("samples", 1005.0, 1009.0)
+    assert result["samples"] == 5
+    assert result["flow_eastwest"]["mean"] == 7.0
+
+
+def test_query_cycles_uses_flows_since_begin_cycle():
+    history = History()
+    history.add_sample({"east": {"car": 100}}, t=990.0)
+    history.begin_cycle()
+    history.add_sample({"east": {"car": 2}}, t=1000.0)
+    history.add_sample({"east": {"car": 4}}, t=1001.0)
+    history.add_cycle(1000.0, "EW", (1.5, 0.5), 20, t=1002.0)
+    result = history.query("cycles", end=1010.0)
+    assert result["cycles"] == 1
+    assert result["green_EW"] == {"mean": 20.0, "min": 20, "max": 20}
+    assert result["mean_flow"] == [3.0, 0.0]
+    assert result["last_ma"] == [1.5, 0.5]
+
+
+def test_query_unknown_kind():
+    with pytest.raises(ValueError):
+        History().query("minutes")
@@ -0,0 +1,46 @@
+# test_predictive.py
+from predictive import PredictiveController
+
+
+def sample(ew_cars, ns_cars, red_ew, red_ns):
+    return {"east": {"car": ew_cars}, "north": {"car": ns_cars},
+            "red_time_eastwest": red_ew, "red_time_northsouth": red_ns}
+
+
+def test_observe_estimates_queue_and_arrival_rate():
+    controller = PredictiveController()
+    for i in range(10):
+        controller.observe(sample(2 * i, 0, 20 - i, 0))
+    assert controller.queue["EW"] == 18
+    assert controller.rate["EW"] > 0
+    assert controller.rate["NS"] == 0
+
+
+def test_repeated_red_times_update_the_queue_only():
+    controller = PredictiveController()
+    controller.observe(sample(2, 0, 20, 0))
+    controller.observe(sample(4, 0, 19, 0))
+    rate = controller.rate["EW"]
+    controller.observe(sample(10, 0, 19, 0))
+    assert controller.queue["EW"] == 10
+    assert controller.rate["EW"] == rate
+
+
+def test_green_time_is_bounded_and_grows_with_the_queue():
+    controller = PredictiveController(t_min=15, t_max=45)
+    controller.observe(sample(0, 0, 20, 0))
+    short = controller.green_time("EW")
+    controller.observe(sample(60, 0, 19, 0))
+    long = controller.green_time("EW")
+    assert 15 <= short <= long <= 45
+    assert long > short
+
+
+def test_state_round_trip():
+    controller = PredictiveController()
+    for i in range(5):
+        controller.observe(sample(i, 2 * i, 20 - i, 0))
+    restored = PredictiveController()
+    restored.set_state(controller.get_state())
+    assert restored.get_state() == controller.get_state()
+    assert restored.green_time("NS") == controller.green_time("NS")
@@ -0,0 +1,34 @@
+# test_serial_protocol.py
+import serial_protocol as sp
+
+
+def test_crc16_check_value():
+    # Standard check value of CRC-16/CCITT-FALSE
+    assert sp.crc16(b"123456789") == 0x29B1
+
+
+def test_timers_frame_round_trip():
+    parser = sp.FrameParser()
+    events = parser.feed(sp.encode_timers(7, ew=20, ns=None))
+    assert len(events) == 1
+    kind, frame_type, seq, payload = events[0]
+    assert (kind, frame_type, seq) == ("frame", sp.TYPE_TIMERS, 7)
+    assert sp.decode_timers(payload) == (20, None)
+
+
+def test_parser_handles_split_frames_and_lines():
+    parser = sp.FrameParser()
+    data = b"READY\n" + sp.encode_frame(sp.TYPE_ACK, 3, bytes((sp.ACK_OK,))) + b"15,EW\n"
+    events = []
+    for i in range(len(data)):
+        events += parser.feed(data[i:i + 1])
+    assert events == [("line", "READY"), ("frame", sp.TYPE_ACK, 3, bytes((sp.ACK_OK,))), ("line", "15,EW")]
+
+
+def test_parser_reports_bad_crc_and_resynchronizes():
+    frame = bytearray(sp.encode_timers(9, ew=30, ns=33))
+    frame[-1] ^= 0xFF
+    parser = sp.FrameParser()
+    events = parser.feed(bytes(frame) + sp.encode_timers(10, ew=31))
+    assert events[0] == ("bad", 9)
+    assert events[-1][:3] == ("frame", sp.TYPE_TIMERS, 10)
@@ -0,0 +1,106 @@
+# trace_report.py
+import argparse
+import glob
+import json
+import os
+
+from bench_utils import latency_summary, save_json
+
+
+def load_traces(paths):
+    """Reads the traces of the given .jsonl files or directories of them; missing paths are skipped."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.jsonl"))))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            print(f"Skipping {path}: not found (traces are written by runs with TRAFFIC_TRACE=1)")
+    traces = []
+    for name in files:
+        with open(name) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    traces.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # A line cut off by a crash
+    return traces
+
+
+def source_group(trace):
+    """Groups traces by their origin: "sim", "camera-EW", "camera-NS", "tcp" or "bus"."""
+    return trace.get("source") or trace.get("id", "?").rsplit("-", 2)[0]
+
+
+def summarize(traces):
+    """
+    Computes the latency percentiles (milliseconds) of each hop, per source group.
+
+    A hop is the time between two consecutive stamps of a trace, e.g. "send->receive".
+    "total" runs from the first stamp to the last, and "to_serial" from the first
+    stamp to the write to the Arduino (traces without a serial write are left out).
+
+    Returns:
+        dict: group -> {"traces": n, "hops": {hop: summary}, "total": summary, "to_serial": summary}
+    """
+    groups = {}
+    for trace in traces:
+        stamps = trace.get("stamps") or []
+        if len(stamps) < 2:
+            continue
+        group = groups.setdefault(source_group(trace), {"traces": 0, "hops": {}, "total": [], "to_serial": []})
+        group["traces"] += 1
+        for (a, ta), (b, tb) in zip(stamps, stamps[1:]):
+            group["hops"].setdefault(f"{a}->{b}", []).append((tb - ta) / 1e6)
+        start = stamps[0][1]
+        group["total"].append((stamps[-1][1] - start) / 1e6)
+        serial = next((t for hop, t in stamps if hop == "serial"), None)
+        if serial is not None:
+            group["to_serial"].append((serial - start) / 1e6)
+    for group in groups.values():
+        group["hops"] = {hop: dict(latency_summary(values), n=len(values)) for hop, values in group["hops"].items()}
+        for key in ("total", "to_serial"):
+            group[key] = dict(latency_summary(group[key]), n=len(group[key]))
+    return groups
+
+
+def print_group(name, group, budget):
+    print(f"\n{name}: {group['traces']} traces")
+    print(f"  {'hop':<22}{'n':>8}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}  (ms)")
+    rows = list(group["hops"].items()) + [("total", group["total"]), ("to_serial", group["to_serial"])]
+    for hop, s in rows:
+        if not s["n"]:
+            continue
+        print(f"  {hop:<22}{s['n']:>8}" + "".join(f"{s[k]:>10.3f}" for k in ("mean", "p50", "p90", "p99", "max")))
+    if budget is not None:
+        end = group["to_serial"] if group["to_serial"]["n"] else group["total"]
+        worst = max(group["hops"].items(), key=lambda item: item[1]["p99"])
+        status = "over" if end["p99"] > budget else "within"
+        print(f"  p99 {end['p99']:.3f} ms is {status} the {budget:g} ms budget; "
+              f"slowest hop at p99: {worst[0]} ({worst[1]['p99']:.3f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-hop latency percentiles of the traces written with TRAFFIC_TRACE")
+    parser.add_argument("paths", nargs="*", default=["traces"], help="Trace files or directories (default: traces)")
+    parser.add_argument("--budget", type=float, help="End-to-end latency budget (ms) checked against the p99")
+    parser.add_argument("--output", help="Also write the summary to this JSON file")
+    args = parser.parse_args()
+
+    traces = load_traces(args.paths)
+    if not traces:
+        print("No traces found in", ", ".join(args.paths))
+        return
+    groups = summarize(traces)
+    for name in sorted(groups):
+        print_group(name, groups[name], args.budget)
+    if args.output:
+        save_json(args.output, groups)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# tracing.py
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+# Opt-in latency tracing, configured by environment variables:
+#   TRAFFIC_TRACE       Empty/unset: disabled. Otherwise every script adds a trace to
+#                       the samples it sends, and control.py writes the completed traces.
+#   TRAFFIC_TRACE_DIR   Output directory of control.py (default: traces).
+# A trace is {"id", "source", "stamps": [[hop, monotonic ns], ...]} and travels in the
+# "trace" field of a sample. Stamps of different processes are comparable because they
+# come from the system-wide monotonic clock, so all scripts must run on the same host.
+ENABLED = os.environ.get("TRAFFIC_TRACE", "") not in ("", "0")
+TRACE_DIR = os.environ.get("TRAFFIC_TRACE_DIR", "traces")
+FLUSH_INTERVAL = 1.0  # Seconds between two flushes of the trace file
+
+_lock = threading.Lock()
+_local = threading.local()
+_count = 0
+_file = None
+_last_flush = 0.0
+
+now = time.monotonic_ns
+
+
+def start(source, hop, t=None):
+    """
+    Starts a trace with its first stamp.
+
+    Returns:
+        dict: The trace, or None when tracing is disabled.
+    """
+    global _count
+    if not ENABLED:
+        return None
+    with _lock:
+        _count += 1
+        n = _count
+    return {"id": f"{source}-{os.getpid()}-{n}", "source": source, "stamps": [[hop, now() if t is None else t]]}
+
+
+def stamp(trace, hop, t=None):
+    """Adds a stamp to a trace (no-op for None)."""
+    if trace is not None:
+        trace["stamps"].append([hop, now() if t is None else t])
+
+
+def received(trace, source, t):
+    """
+    Continues the trace of a received sample with a "receive" stamp at `t`.
+
+    Samples without a valid trace get a new one, so that the controller's hops are
+    traced even for clients that do not trace.
+
+    Returns:
+        dict: The trace, or None when tracing is disabled.
+    """
+    if not ENABLED:
+        return None
+    if not (isinstance(trace, dict) and isinstance(trace.get("stamps"), list)):
+        return start(source, "receive", t)
+    trace.setdefault("source", source)
+    stamp(trace, "receive", t)
+    return trace
+
+
+def activate(trace):
+    """Makes `trace` the calling thread's current trace (see stamp_current())."""
+    _local.trace = trace
+
+
+def stamp_current(hop):
+    """Stamps the current trace once per hop, e.g. from send_to_arduino() deep in the call chain."""
+    trace = getattr(_local, "trace", None)
+    if trace is not None and not any(s[0] == hop for s in trace["stamps"]):
+        stamp(trace, hop)
+
+
+def record(trace, **fields):
+    """Appends a completed trace, with extra fields, to the trace file of this process."""
+    global _file, _last_flush
+    if trace is None:
+        return
+    line = json.dumps(dict(trace, **fields), separators=(",", ":")) + "\n"
+    with _lock:
+        if _file is None:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            prog = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+            _file = open(os.path.join(TRACE_DIR, f"{prog}-{os.getpid()}-traces.jsonl"), "a")
+            atexit.register(close)
+        _file.write(line)
+        t = time.monotonic()
+        if t - _last_flush >= FLUSH_INTERVAL:
+            _file.flush()
+            _last_flush = t
+
+
+def close():
+    global _file
+    with _lock:
+        if _file is not None:
+            _file.close()
+            _file = None